@@ -0,0 +1,56 @@
+import os
+import sys
+import argparse
+import importlib
+import importlib.util
+import importlib.machinery
+
+##########################################
+# Headless entry point, run it without Blender:
+#     python cli.py texconv textures/ out/ --to png
+#     python cli.py index catalog.db dump/ --find face_01.xi
+#     python cli.py xpck verify dump/ --deep
+#     python cli.py xpck diff old.xc new.xc
+##########################################
+
+# Worker processes started from Blender run this file with the name Blender gave the addon
+PACKAGE_NAME = globals().get("PACKAGE_NAME", "studio_eleven")
+ADDON_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def register_package(name, directories):
+    spec = importlib.machinery.ModuleSpec(name, None, is_package=True)
+    spec.submodule_search_locations = directories
+    sys.modules[name] = importlib.util.module_from_spec(spec)
+
+def load_package():
+    # Register the addon folder as a package without running its __init__, which needs bpy
+    if PACKAGE_NAME not in sys.modules:
+        # Parents of an extension package (bl_ext.user_default) are left empty
+        parts = PACKAGE_NAME.split(".")
+        for i in range(1, len(parts)):
+            if ".".join(parts[:i]) not in sys.modules:
+                register_package(".".join(parts[:i]), [])
+
+        register_package(PACKAGE_NAME, [ADDON_DIRECTORY])
+
+    return sys.modules[PACKAGE_NAME]
+
+def load_tool(name):
+    return importlib.import_module(PACKAGE_NAME + ".tools." + name)
+
+# Done at import time so the worker processes can unpickle the tool functions
+load_package()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="studio_eleven", description="Studio Eleven command line tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    load_tool("texconv").add_arguments(subparsers.add_parser("texconv", help="Convert IMGC textures to and from PNG or raw RGBA"))
+    load_tool("catalog").add_arguments(subparsers.add_parser("index", help="Index the entries of every archive of a directory in a SQLite catalog"))
+    load_tool("archive").add_arguments(subparsers.add_parser("xpck", help="Check or compare XPCK/XFSP archives"))
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,44 @@
 from ..compression import *
 
-def decompress(data):
+METHOD_NAMES = {
+    0: "NONE",
+    1: "LZSS",
+    2: "HUFFMAN4",
+    3: "HUFFMAN8",
+    4: "RLE",
+    5: "ZLIB",
+}
+
+def read_method(data):
     size_method_buffer = data[:4]
     size = (size_method_buffer[0] >> 3) | (size_method_buffer[1] << 5) | \
            (size_method_buffer[2] << 13) | (size_method_buffer[3] << 21)
 
     method = size_method_buffer[0] & 0x7
     
+    return method, size
+
+def is_compressed(data, length=None):
+    # There is no flag, only check that the size/method header is plausible
+    # length is the full size when data only holds the first bytes
+    if length is None:
+        length = len(data)
+    
+    if len(data) < 4 or length < 4:
+        return False
+    
+    method, size = read_method(data)
+    
+    if method == 0:
+        return 0 < size <= length - 4
+    elif method in METHOD_NAMES:
+        return 0 < size <= length * 1024
+    else:
+        return False
+
+def decompress(data):
+    method, size = read_method(data)
+    
     if method == 0:
         return data[4:]
     elif method == 1:
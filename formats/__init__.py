@@ -1,9 +1,14 @@
 from .imgc import *
 from .xmpr import *
 from .xpck import *
-from .mbn import *
 from .res import *
-from .mbn import *
+
+# Needs mathutils, missing when the tools run outside of Blender
+try:
+    from .mbn import *
+except ImportError:
+    pass
+
 from .xcma import *
 from .minf import *
 from .xcsl import *
@@ -27,12 +27,20 @@ def get_pixels(img):
      
     return flip_vertically(px, img.size[1], img.size[0])
 
+def select_format(img, max_error):
+    pixels = np.empty(len(img.pixels), dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+    
+    # Same truncation as get_pixels
+    px = (pixels * 255).astype(np.uint8).reshape(-1, 4)
+    
+    return img_tool.select_image_format(px, max_error)
+
 def write(img, img_format):
+    return write_pixels(get_pixels(img), img.size[0], img.size[1], img_format)
+
+def write_pixels(px, width, height, img_format):
     out = bytes()
-    
-    height = img.size[1]
-    width = img.size[0]
-    px = get_pixels(img)
 
     tile_compress = lz10.compress(image_to_tile(px, height, width))
     image_data_compress = lz10.compress(encode_image(px, height, width, img_format))
@@ -102,7 +110,16 @@ class IMGCSupport:
 # IMGC Open Function
 ##########################################
 
-def open(file_content):
+# Bump it when the decoded pixels change, so cached textures are decoded again
+DECODER_VERSION = 2
+
+def open(file_content, lod=0, cache=None):
+    if cache is not None:
+        cache_key = cache.make_key(file_content, DECODER_VERSION, lod)
+        cached_image = cache.get(cache_key)
+        if cached_image is not None:
+            return cached_image
+
     data = BytesIO(file_content)
 
     # Reading and unpacking the header data
@@ -116,7 +133,16 @@ def open(file_content):
     data.seek(header.TileOffset + header.TileSize2)
     image_data = compressor.decompress(data.read(header.ImageSize))
 
-    if header.ImageFormat in header.ImageFormats:
-        return img_tool.decode_image(tile_data, image_data, header.ImageFormats[header.ImageFormat], header.Width, header.Height, header.BitDepth)
-    else:
+    if header.ImageFormat not in header.ImageFormats:
         return None
+
+    # lod > 0 only samples one texel per 2^lod block to make a preview
+    if lod > 0:
+        image = img_tool.decode_image_preview(tile_data, image_data, header.ImageFormats[header.ImageFormat], header.Width, header.Height, header.BitDepth, lod)
+    else:
+        image = img_tool.decode_image(tile_data, image_data, header.ImageFormats[header.ImageFormat], header.Width, header.Height, header.BitDepth)
+
+    if cache is not None:
+        cache.put(cache_key, *image)
+
+    return image
\ No newline at end of file
@@ -4,6 +4,7 @@ from struct import pack, unpack, unpack_from, Struct
 
 from enum import Enum
 from ..compression import *
+from ..utils.hash_dictionary import get_hash_dictionary
 
 ##########################################
 # RESType
@@ -109,6 +110,13 @@ def read_string_table(data):
             text += char
     return string_table
 
+def get_name(string_table, obj_hash):
+    if obj_hash in string_table:
+        return string_table[obj_hash]
+    
+    # Names from the other archives seen so far
+    return get_hash_dictionary().get(obj_hash, f"0x{obj_hash:08X}")
+
 def open_res(data):
     data = compressor.decompress(data)
     
@@ -122,6 +130,7 @@ def open_res(data):
     
     text_section = data[header.StringOffset:len(data)]
     string_table = read_string_table(text_section)
+    get_hash_dictionary().update(string_table)
     
     def read_section_table(data, tableOffset, tableCount):
         for i in range(tableCount):
@@ -142,10 +151,7 @@ def open_res(data):
                 pos = 0
                 
                 obj_hash = unpack_from("<I", section, pos)[0]
-                if obj_hash in string_table:
-                    obj_name = string_table[obj_hash]
-                else:
-                    obj_name = f"0x{obj_hash:08X}"
+                obj_name = get_name(string_table, obj_hash)
                 
                 if headerTable.Length == 8:
                     items[RESType(headerTable.Type)][obj_hash] = obj_name
@@ -233,6 +239,7 @@ def open_xres(data):
     
     text_section = data[header.StringOffset:len(data)]
     string_table = read_string_table(text_section)
+    get_hash_dictionary().update(string_table)
     
     def read_type(data, headerTable, Type):
         if Type not in items:
@@ -244,7 +251,7 @@ def open_xres(data):
             
             pos = 0
             obj_hash = unpack_from("<I", section, pos)[0]
-            obj_name = string_table[obj_hash]
+            obj_name = get_name(string_table, obj_hash)
             
             if Type == RESType.TEXTURE_DATA:
                 pos = 8
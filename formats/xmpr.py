@@ -1,10 +1,95 @@
 import zlib
 import struct
 import io
+import numpy as np
 
 from ..utils import *
 from ..compression import lz10, compressor
 
+##########################################
+# XPVB Layout
+##########################################
+
+# Slots of the XPVB attribute table
+ATTRIBUTE_POSITION = 0
+ATTRIBUTE_NORMAL = 2
+ATTRIBUTE_UV0 = 4
+ATTRIBUTE_UV1 = 5
+ATTRIBUTE_WEIGHTS = 7
+ATTRIBUTE_BONE_INDICES = 8
+ATTRIBUTE_COLOR = 9
+
+# Component type of the attribute table to its numpy type, by component size (size / count)
+ATTRIBUTE_TYPES = {
+    0x00: {1: np.dtype("<i1"), 2: np.dtype("<i2")},
+    0x01: {1: np.dtype("<u1"), 2: np.dtype("<u2")},
+    0x02: {2: np.dtype("<f2"), 4: np.dtype("<f4")},
+}
+
+# Integer components are normalized, except where they index something
+UNNORMALIZED_ATTRIBUTES = (ATTRIBUTE_BONE_INDICES,)
+
+# Attribute table of the float layout, 88 bytes per vertex and the UVs written twice
+FLOAT_ATTRIBUTE_TABLE = [
+    (3, 0x00, 0x0C, 0x02),
+    (4, 0x00, 0x10, 0x01),
+    (3, 0x0C, 0x0C, 0x02),
+    (0, 0x00, 0x00, 0x00),
+    (2, 0x18, 0x08, 0x02),
+    (2, 0x20, 0x08, 0x02),
+    (0, 0x00, 0x00, 0x00),
+    (4, 0x28, 0x10, 0x02),
+    (4, 0x38, 0x10, 0x02),
+    (4, 0x48, 0x10, 0x02),
+]
+FLOAT_STRIDE = 0x58
+
+# Block after the attribute table, lz10 compressed, four 1.0 floats
+XPVB_UNK_BLOCK = bytes([0x81, 0x00, 0x00, 0x00, 0x08, 0x00, 0x00, 0x80, 0x3F, 0x90, 0x03, 0x00])
+
+DEFAULT_COLOR = (0.0, 0.0, 0.0, 1.0)
+
+# XPVI primitive types
+PRIMITIVE_TRIANGLES = 0
+PRIMITIVE_TRIANGLE_STRIP = 2
+
+def get_attribute_name(slot):
+    return f"a{slot}"
+
+def get_component_type(component_dtype):
+    for component_type, dtypes in ATTRIBUTE_TYPES.items():
+        if component_dtype in dtypes.values():
+            return component_type
+        
+    raise ValueError(f"No XPVB component type for {component_dtype}")
+
+def make_attribute_table(attributes):
+    # Packs (slot, count, dtype) attributes one after the other, each aligned on its component size
+    attribute_table = [(0, 0, 0, 0)] * 10
+    offset = 0
+    
+    for slot, count, component_dtype in attributes:
+        offset += -offset % component_dtype.itemsize
+        attribute_table[slot] = (count, offset, count * component_dtype.itemsize, get_component_type(component_dtype))
+        offset += count * component_dtype.itemsize
+        
+    return attribute_table, offset + -offset % 4
+
+def write_xpvb(data_geometrie, attribute_table, stride):
+    # Uncompressed block: size << 3 with method 0
+    attributes = struct.pack("<I", 40 << 3) + bytes(value for attribute in attribute_table for value in attribute)
+    
+    att_buffer_offset = 0x10
+    unk_offset = att_buffer_offset + len(attributes)
+    vertex_buffer_offset = unk_offset + len(XPVB_UNK_BLOCK)
+    
+    xpvb = struct.pack("<4sHHHHI", b"XPVB", att_buffer_offset, unk_offset, vertex_buffer_offset, stride, len(data_geometrie) // stride)
+    xpvb += attributes
+    xpvb += XPVB_UNK_BLOCK
+    xpvb += lz10.compress(data_geometrie)
+    
+    return xpvb
+
 ##########################################
 # XMPR Write Function
 ##########################################
@@ -69,74 +154,176 @@ def flatten_tuple(tuples_list):
     flat = [x for tup in tuples_list for x in tup]
     return list(dict.fromkeys(flat))
 
-def write_geometrie(indices, vertices, uvs, normals, colors, weights):
-    out = bytes()
+def optimize_mesh(indices, vertices, uvs, normals, colors, weights):
+    # Triangles reordered for the vertex cache, then vertices renumbered in order of first use,
+    # the ACMR before and after is returned with the mesh
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    optimized = optimize_vertex_cache(triangles)
+    acmr = (get_acmr(triangles), get_acmr(optimized))
     
-    indices = flatten_tuple(indices)
+    optimized, remap = optimize_vertex_fetch(optimized)
+    remap = remap.tolist()
     
-    for indice in indices:
-        for v in vertices[indice]:
-            out += bytearray(struct.pack("f", v))
-        for n in normals[indice]:
-            out += bytearray(struct.pack("f", n))
-        for vt in range(2):
-            out += bytearray(struct.pack("f", uvs[indice][0]))
-            out += bytearray(struct.pack("f", 1 - uvs[indice][1] ))
+    return (
+        [tuple(triangle) for triangle in optimized.tolist()],
+        [vertices[i] for i in remap],
+        [uvs[i] for i in remap],
+        [normals[i] for i in remap],
+        [colors[i] for i in remap] if len(colors) > 0 else colors,
+        {new: weights[old] for new, old in enumerate(remap) if old in weights},
+    ), acmr
+
+def get_bounds(vertices):
+    positions = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+    
+    if len(positions) == 0:
+        return [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    
+    low = positions.min(axis=0)
+    high = positions.max(axis=0)
+    
+    return [((low + high) / 2).tolist(), ((high - low) / 2).tolist()]
+
+def get_padded_weights(weights, order):
+    # Up to 4 influences per vertex, missing ones are zero
+    vertex_weights = np.zeros((len(order), 4), dtype=np.float32)
+    vertex_bones = np.zeros((len(order), 4), dtype=np.int32)
+    
+    for i, indice in enumerate(order):
+        weight = weights.get(indice, {})
+        keys = list(weight.keys())[:4]
+        vertex_weights[i, :len(keys)] = [weight[key] for key in keys]
+        vertex_bones[i, :len(keys)] = keys
             
-        weight = weights[indice]
-        keys = list(weight.keys())
-        for w in range(4):
-            if w < len(keys):
-                out += bytearray(struct.pack("f", float(weight[keys[w]])))
-            else:
-                out += int(0).to_bytes(4, 'little')
-        for x in range(4):
-            if x < len(keys):
-                out += bytearray(struct.pack("f", float(keys[x])))
-            else:
-                out += int(0).to_bytes(4, 'little')
-        
-        for c in range(4):
-            if len(colors) > 0:
-                out += bytearray(struct.pack("f", colors[indice][c]))
-            else:
-                out += int(0).to_bytes(4, 'little')
+    return vertex_weights, vertex_bones
+
+def quantize(values, dtype):
+    # Inverse of normalize_attribute
+    limit = np.iinfo(dtype).max
+    low = -limit if np.iinfo(dtype).min < 0 else 0
+    
+    return np.clip(np.round(values * limit), low, limit).astype(dtype)
+
+def quantize_weights(vertex_weights):
+    out = quantize(vertex_weights, np.uint8).astype(np.int32)
+    
+    # Keep the bytes of normalized weights summing to 255
+    totals = vertex_weights.sum(axis=1)
+    normalized = np.abs(totals - 1.0) < 1e-3
+    largest = out.argmax(axis=1)
+    rows = np.arange(len(out))
+    out[rows, largest] += np.where(normalized, 255 - out.sum(axis=1), 0)
+    
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+def write_geometrie(indices, vertices, uvs, normals, colors, weights):
+    order = flatten_tuple(indices)
+    vertex_array = np.zeros(len(order), dtype=make_vertex_dtype(FLOAT_ATTRIBUTE_TABLE, FLOAT_STRIDE))
+    
+    vertex_uvs = np.asarray(uvs, dtype=np.float64).reshape(-1, 2)[order]
+    vertex_uvs[:, 1] = 1.0 - vertex_uvs[:, 1]
+    vertex_weights, vertex_bones = get_padded_weights(weights, order)
+    
+    vertex_array[get_attribute_name(ATTRIBUTE_POSITION)] = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)[order]
+    vertex_array[get_attribute_name(ATTRIBUTE_NORMAL)] = np.asarray(normals, dtype=np.float32).reshape(-1, 3)[order]
+    vertex_array[get_attribute_name(ATTRIBUTE_UV0)] = vertex_uvs
+    vertex_array[get_attribute_name(ATTRIBUTE_UV1)] = vertex_uvs
+    vertex_array[get_attribute_name(ATTRIBUTE_WEIGHTS)] = vertex_weights
+    
+    # Bone indices are stored as floats in this layout
+    vertex_array[get_attribute_name(ATTRIBUTE_BONE_INDICES)] = vertex_bones
+    
+    if len(colors) > 0:
+        vertex_array[get_attribute_name(ATTRIBUTE_COLOR)] = np.asarray(colors, dtype=np.float32).reshape(-1, 4)[order]
                 
-    return out
+    return vertex_array.tobytes()
+    
+def write_geometrie_compact(indices, vertices, uvs, normals, colors, weights, texspace):
+    order = flatten_tuple(indices)
+    
+    positions = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)[order]
+    vertex_normals = np.asarray(normals, dtype=np.float32).reshape(-1, 3)[order]
+    vertex_uvs = np.asarray(uvs, dtype=np.float32).reshape(-1, 2)[order]
+    vertex_uvs[:, 1] = 1.0 - vertex_uvs[:, 1]
+    vertex_weights, vertex_bones = get_padded_weights(weights, order)
+    
+    vertex_colors = None
+    if len(colors) > 0:
+        vertex_colors = np.asarray(colors, dtype=np.float32).reshape(-1, 4)[order]
+        if np.all(vertex_colors == DEFAULT_COLOR):
+            vertex_colors = None
+    
+    # Only the attributes the mesh uses are written
+    attributes = [
+        (ATTRIBUTE_POSITION, 3, np.dtype("<i2")),
+        (ATTRIBUTE_NORMAL, 3, np.dtype("<i1")),
+        (ATTRIBUTE_UV0, 2, np.dtype("<u2") if np.all((vertex_uvs >= 0) & (vertex_uvs <= 1)) else np.dtype("<f4")),
+    ]
+    
+    has_weights = bool(np.any(vertex_weights))
+    if has_weights:
+        attributes.append((ATTRIBUTE_WEIGHTS, 4, np.dtype("<u1")))
+        attributes.append((ATTRIBUTE_BONE_INDICES, 4, np.dtype("<u1") if vertex_bones.max() < 256 else np.dtype("<u2")))
+    
+    if vertex_colors is not None:
+        attributes.append((ATTRIBUTE_COLOR, 4, np.dtype("<u1")))
+        
+    attribute_table, stride = make_attribute_table(attributes)
+    vertex_array = np.zeros(len(order), dtype=make_vertex_dtype(attribute_table, stride))
+    
+    location = np.asarray(texspace[0], dtype=np.float32)
+    size = np.asarray(texspace[1], dtype=np.float32)
+    vertex_array[get_attribute_name(ATTRIBUTE_POSITION)] = quantize((positions - location) / np.where(size == 0, 1, size), np.int16)
+    vertex_array[get_attribute_name(ATTRIBUTE_NORMAL)] = quantize(vertex_normals, np.int8)
+    
+    if vertex_uvs.dtype == vertex_array[get_attribute_name(ATTRIBUTE_UV0)].dtype:
+        vertex_array[get_attribute_name(ATTRIBUTE_UV0)] = vertex_uvs
+    else:
+        vertex_array[get_attribute_name(ATTRIBUTE_UV0)] = quantize(vertex_uvs, vertex_array[get_attribute_name(ATTRIBUTE_UV0)].dtype)
     
-def write_triangle(indices):
-    out = bytes()
+    if has_weights:
+        vertex_array[get_attribute_name(ATTRIBUTE_WEIGHTS)] = quantize_weights(vertex_weights)
+        vertex_array[get_attribute_name(ATTRIBUTE_BONE_INDICES)] = vertex_bones
     
-    triangle_strip = stripify(indices, True)
+    if vertex_colors is not None:
+        vertex_array[get_attribute_name(ATTRIBUTE_COLOR)] = quantize(vertex_colors, np.uint8)
+        
+    return vertex_array.tobytes(), attribute_table, stride
+
+def write_triangle(indices, strip_effort = "FULL", jobs = None):
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    triangle_strip = stripify_array(triangles, strip_effort, True, jobs)[0]
     
-    for i in range(len(triangle_strip)):
-        for j in range(len(triangle_strip[i])):
-            out += int(triangle_strip[i][j]).to_bytes(2, 'little')
+    # A plain triangle list when the strip isn't shorter
+    if len(triangle_strip) >= triangles.size:
+        return triangles.astype('<u2').tobytes(), PRIMITIVE_TRIANGLES
           
-    return out
+    return np.asarray(triangle_strip, dtype='<u2').tobytes(), PRIMITIVE_TRIANGLE_STRIP
                 
-def write(mesh_name, texspace, indices, vertices, uvs, normals, colors, weights, bone_names, material_name, mode, single_bind = None, draw_priority = 21, mesh_type = 1):
+def write(mesh_name, texspace, indices, vertices, uvs, normals, colors, weights, bone_names, material_name, mode, single_bind = None, draw_priority = 21, mesh_type = 1, vertex_layout = "FLOAT", strip_effort = "FULL", optimize_cache = False, jobs = None):
+    if optimize_cache:
+        (indices, vertices, uvs, normals, colors, weights), _ = optimize_mesh(indices, vertices, uvs, normals, colors, weights)
+    
     # Get only used bones
     bone_names = used_bones(weights, bone_names)
     weights = used_weights(weights)
     
     # Get content data
-    data_geometrie = write_geometrie(indices, vertices, uvs, normals, colors, weights)
-    data_triangle = write_triangle(indices)
+    if vertex_layout == "COMPACT":
+        # Positions are stored relative to the texture space box, which becomes the mesh bounds
+        texspace = get_bounds(vertices)
+        data_geometrie, attribute_table, stride = write_geometrie_compact(indices, vertices, uvs, normals, colors, weights, texspace)
+    else:
+        data_geometrie = write_geometrie(indices, vertices, uvs, normals, colors, weights)
+        attribute_table, stride = FLOAT_ATTRIBUTE_TABLE, FLOAT_STRIDE
+    data_triangle, primitive_type = write_triangle(indices, strip_effort, jobs)
 
     # XPVB-------------------------------------------
-    compress_geometrie = lz10.compress(data_geometrie) 
-    xpvb = bytes()
-    xpvb += bytes([int(x,0) for x in ["0x58", "0x50", "0x56", "0x42", "0x10", "0x00", "0x3C", "0x00", "0x48", "0x00", "0x58", "0x00"] ])
-    xpvb += int(len(data_geometrie)/88).to_bytes(4, 'little')
-    xpvb += bytes([int(x,0) for x in ["0x40", "0x01", "0x00", "0x00", "0x03", "0x00", "0x0C", "0x02", "0x04", "0x00", "0x10", "0x01", "0x03", "0x0C", "0x0C", "0x02", "0x00", "0x00", "0x00", "0x00", "0x02", "0x18", "0x08", "0x02", "0x02", "0x20", "0x08", "0x02", "0x00", "0x00", "0x00", "0x00", "0x04", "0x28", "0x10", "0x02", "0x04", "0x38", "0x10", "0x02", "0x04", "0x48", "0x10", "0x02", "0x81", "0x00", "0x00", "0x00", "0x08", "0x00", "0x00", "0x80", "0x3F", "0x90", "0x03", "0x00"] ])
-    xpvb += compress_geometrie
+    xpvb = write_xpvb(data_geometrie, attribute_table, stride)
 
     # XPVI-------------------------------------------
     compress_triangle = lz10.compress(data_triangle) 
-    xpvi = bytes()
-    xpvi += bytes([int(x,0) for x in ["0x58", "0x50", "0x56", "0x49", "0x02", "0x00", "0x0c", "0x00"] ])
-    xpvi += int(len(data_triangle)/2).to_bytes(4, 'little')
+    xpvi = struct.pack("<4sHHI", b"XPVI", primitive_type, 0x0C, len(data_triangle) // 2)
     xpvi += compress_triangle
 
     # Material-------------------------------------------
@@ -207,24 +394,70 @@ def write(mesh_name, texspace, indices, vertices, uvs, normals, colors, weights,
 # XMPR Open Function
 ##########################################
 
-def read_vertex(reader, count, aType, size):
-    v = (0.0, 0.0, 0.0, 0.0)
-    if count != 0x00:
-        if aType == 0x02:
-            return struct.unpack(f"<{count}f", reader.read(size))
-    return v
-
-def parse_buffer(reader, node_table):
-    vertices = {
-        "positions": [],
-        "normals": [],
-        "uv_data0": [],
-        "uv_data1": [],
-        "weights": [],
-        "bone_indices": [],
-        "color_data": [],
-    }
-    
+def read_attribute_table(data):
+    # 10 slots of (count, offset, size, type)
+    return np.frombuffer(data, dtype=np.uint8, count=40).reshape(10, 4).tolist()
+
+def get_component_dtype(count, size, component_type):
+    if count == 0 or size % count != 0:
+        return None
+
+    return ATTRIBUTE_TYPES.get(component_type, {}).get(size // count)
+
+def make_vertex_dtype(attributes, stride):
+    names = []
+    formats = []
+    offsets = []
+
+    for slot, (count, offset, size, component_type) in enumerate(attributes):
+        component_dtype = get_component_dtype(count, size, component_type)
+        if component_dtype is None:
+            continue
+
+        names.append(get_attribute_name(slot))
+        formats.append((component_dtype, (count,)))
+        offsets.append(offset)
+
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": stride})
+
+def normalize_attribute(column):
+    if column.dtype.kind == 'f':
+        return column.astype(np.float32)
+
+    # Signed types map to [-1, 1], unsigned types to [0, 1]
+    out = column.astype(np.float32) / np.iinfo(column.dtype).max
+    if column.dtype.kind == 'i':
+        np.maximum(out, -1.0, out=out)
+
+    return out
+
+def get_attribute(vertex_array, attributes, slot, width, warnings):
+    count, offset, size, component_type = attributes[slot]
+
+    # Attributes without elements are empty
+    if count == 0:
+        return np.zeros((0, width), dtype=np.float32)
+
+    out = np.zeros((len(vertex_array), width), dtype=np.float32)
+
+    name = get_attribute_name(slot)
+    if name not in vertex_array.dtype.names:
+        warnings.append(f"Unsupported XPVB attribute {slot}: type {component_type:#x} with {count} components in {size} bytes")
+        return out
+
+    column = vertex_array[name][:, :width]
+    if slot in UNNORMALIZED_ATTRIBUTES:
+        out[:, :column.shape[1]] = column
+    else:
+        out[:, :column.shape[1]] = normalize_attribute(column)
+
+    return out
+
+def parse_buffer(reader, node_table, texspace=None, warnings=None):
+    # Attributes that can't be read are left empty and explained in warnings
+    if warnings is None:
+        warnings = []
+
     xpvb_magic = struct.unpack("<4s", reader.read(4))[0]
     att_buffer_offset = struct.unpack("<H", reader.read(2))[0]
     unk_offset = struct.unpack("<H", reader.read(2))[0]
@@ -233,96 +466,79 @@ def parse_buffer(reader, node_table):
     vertex_count = struct.unpack("<I", reader.read(4))[0]
     
     reader.seek(att_buffer_offset)
-    attbuffer = io.BytesIO(compressor.decompress(reader.read(unk_offset - att_buffer_offset)))
-    aCount = [int] * 10
-    aOffset = [int] * 10
-    aSize = [int] * 10
-    aType = [int] * 10
-    for i in range(10):
-        aCount[i]  = struct.unpack("<B", attbuffer.read(1))[0]
-        aOffset[i] = struct.unpack("<B", attbuffer.read(1))[0]
-        aSize[i]   = struct.unpack("<B", attbuffer.read(1))[0]
-        aType[i]   = struct.unpack("<B", attbuffer.read(1))[0]
-    attbuffer.close()
+    attributes = read_attribute_table(compressor.decompress(reader.read(unk_offset - att_buffer_offset)))
     
     reader.seek(vertex_buffer_offset)
-    vbuffer = io.BytesIO(compressor.decompress(reader.read()))
-    
-    for i in range(vertex_count):
-        for j in range(10):
-            vbuffer.seek(i * stride + aOffset[j])
-            
-            # Ignore attributes without elements
-            if aCount[j] == 0:
-                continue
-            
-            if j == 0:
-                vertices["positions"].append(
-                    read_vertex(vbuffer, aCount[j], aType[j], aSize[j])[:3]
-                )
-            elif j == 2:
-                vertices["normals"].append(
-                    read_vertex(vbuffer, aCount[j], aType[j], aSize[j])[:3]
-                )
-            elif j == 4:
-                uv_data0 = list(read_vertex(vbuffer, aCount[j], aType[j], aSize[j]))[:2]
-                uv_data0[1] = 1.0 - uv_data0[1]
-                vertices["uv_data0"].append(
-                    tuple(uv_data0)
-                )
-            elif j == 5:
-                uv_data1 = list(read_vertex(vbuffer, aCount[j], aType[j], aSize[j]))[:2]
-                uv_data1[1] = 1.0 - uv_data1[1]
-                vertices["uv_data1"].append(
-                    tuple(uv_data1)
-                )
-            elif j == 7:
-                vertices["weights"].append(
-                    read_vertex(vbuffer, aCount[j], aType[j], aSize[j])
-                )
-            elif j == 8:
-                bone_indices = read_vertex(vbuffer, aCount[j], aType[j], aSize[j])
-                if node_table:
-                    vertices["bone_indices"].append((
-                        node_table[int(bone_indices[0])],
-                        node_table[int(bone_indices[1])],
-                        node_table[int(bone_indices[2])],
-                        node_table[int(bone_indices[3])],
-                    ))
-            elif j == 9:
-                vertices["color_data"].append(
-                    read_vertex(vbuffer, aCount[j], aType[j], aSize[j])
-                )
-                
-    vbuffer.close()
+    vbuffer = compressor.decompress(reader.read())
     reader.close()
+    
+    # One view over the whole interleaved buffer, every attribute is a column
+    vertex_array = np.frombuffer(vbuffer, dtype=make_vertex_dtype(attributes, stride), count=vertex_count)
+    
+    uv_data0 = get_attribute(vertex_array, attributes, ATTRIBUTE_UV0, 2, warnings)
+    uv_data0[:, 1] = 1.0 - uv_data0[:, 1]
+    uv_data1 = get_attribute(vertex_array, attributes, ATTRIBUTE_UV1, 2, warnings)
+    uv_data1[:, 1] = 1.0 - uv_data1[:, 1]
+    
+    bone_indices = get_attribute(vertex_array, attributes, ATTRIBUTE_BONE_INDICES, 4, warnings)
+    if node_table:
+        bone_indices = np.asarray(node_table, dtype=np.uint32)[bone_indices.astype(np.intp)]
+    else:
+        bone_indices = np.zeros((0, 4), dtype=np.uint32)
 
-    return vertices
+    # Integer positions are normalized to the texture space box
+    positions = get_attribute(vertex_array, attributes, ATTRIBUTE_POSITION, 3, warnings)
+    position_name = get_attribute_name(ATTRIBUTE_POSITION)
+    if texspace and position_name in vertex_array.dtype.names and vertex_array.dtype[position_name].base.kind != 'f':
+        positions = positions * np.asarray(texspace[1], dtype=np.float32) + np.asarray(texspace[0], dtype=np.float32)
+
+    return {
+        "positions": positions,
+        "normals": get_attribute(vertex_array, attributes, ATTRIBUTE_NORMAL, 3, warnings),
+        "uv_data0": uv_data0,
+        "uv_data1": uv_data1,
+        "weights": get_attribute(vertex_array, attributes, ATTRIBUTE_WEIGHTS, 4, warnings),
+        "bone_indices": bone_indices,
+        "color_data": get_attribute(vertex_array, attributes, ATTRIBUTE_COLOR, 4, warnings),
+    }
+
+def get_triangles(indices, primitive_type):
+    if primitive_type == PRIMITIVE_TRIANGLES:
+        return indices[:len(indices) - len(indices) % 3].reshape(-1, 3)
+    elif primitive_type == PRIMITIVE_TRIANGLE_STRIP:
+        return triangulate_array(indices)
+    else:
+        raise NotImplementedError("Primitive Type not implemented")
 
 def parse_index_buffer(reader):
-    triangles = []
-    
     xpvi_magic = struct.unpack("<4s", reader.read(4))[0]
     primitive_type = struct.unpack("<H", reader.read(2))[0]
     faces_offset = struct.unpack("<H", reader.read(2))[0]
     face_count = struct.unpack("<I", reader.read(4))[0]
     
     reader.seek(faces_offset)
-    ibuffer = io.BytesIO(compressor.decompress(reader.read()))
-    
-    if primitive_type == 0:
-        for i in range(0, face_count, 3):
-            triangles.append(struct.unpack("<HHH", ibuffer.read(6)))
-    elif primitive_type == 2:
-        for i in range(face_count):
-            triangles.append(struct.unpack("<H", ibuffer.read(2))[0])
-        triangles = triangulate([triangles])
-    else:
-        raise NotImplementedError("Primitive Type not implemented")
-    ibuffer.close()
+    indices = np.frombuffer(compressor.decompress(reader.read()), dtype='<u2', count=face_count).astype(np.int32)
     reader.close()
     
-    return triangles
+    return get_triangles(indices, primitive_type)
+
+def get_weight_batches(weights, bone_indices):
+    # Influences summed per vertex and bone, then vertices grouped by bone and weight for vertex_group.add,
+    # buffers without weights or bone indices have nothing to bind
+    if len(weights) == 0 or len(bone_indices) != len(weights):
+        return
+
+    vertex_ids = np.repeat(np.arange(len(weights)), weights.shape[1])
+    influences, influence_ids = np.unique(np.column_stack((vertex_ids, bone_indices.reshape(-1))), axis=0, return_inverse=True)
+    influence_weights = np.bincount(influence_ids.reshape(-1), weights=weights.reshape(-1), minlength=len(influences))
+
+    batches, batch_ids = np.unique(np.column_stack((influences[:, 1], influence_weights)), axis=0, return_inverse=True)
+    batch_ids = batch_ids.reshape(-1)
+    splits = np.cumsum(np.bincount(batch_ids, minlength=len(batches)))[:-1]
+    batch_vertices = np.split(influences[np.argsort(batch_ids, kind='stable'), 0], splits)
+
+    for (bone_idx, weight), vertices in zip(batches.tolist(), batch_vertices):
+        yield int(bone_idx), weight, vertices.tolist()
 
 def open_xmpr(reader):
     xmpr_magic = struct.unpack("<4s", reader.read(4))[0]
@@ -359,7 +575,9 @@ def open_xmpr(reader):
     mat_name_hash = struct.unpack("<I", reader.read(4))[0]
     unk_hash = struct.unpack("<I", reader.read(4))[0]
     mesh_name_split_hash = struct.unpack("<I", reader.read(4))[0]
-    reader.read(32) # unk
+    reader.read(8) # unk
+    texspace_location = struct.unpack("<3f", reader.read(12))
+    texspace_size = struct.unpack("<3f", reader.read(12))
     draw_priority = struct.unpack("<I", reader.read(4))[0]
     mesh_type = struct.unpack("<H", reader.read(2))[0]
     mesh_unk = struct.unpack("<H", reader.read(2))[0]
@@ -384,8 +602,10 @@ def open_xmpr(reader):
     
     reader.close()
     
+    warnings = []
+    
     return {
-        "vertices": parse_buffer(xpvb, node_table),
+        "vertices": parse_buffer(xpvb, node_table, (texspace_location, texspace_size), warnings),
         "triangles": parse_index_buffer(xpvi),
         "node_table": node_table,
         "name": mesh_name,
@@ -393,4 +613,5 @@ def open_xmpr(reader):
         "single_bind": single_bind,
         "draw_priority": draw_priority,
         "mesh_type": mesh_type,
+        "warnings": warnings,
     }
@@ -1,8 +1,12 @@
 import os
 import math
+import mmap
+import hashlib
 import zlib
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from, Struct
+from collections import namedtuple, Counter
 from ..compression import *
+from ..utils.hash_dictionary import get_hash_dictionary
 
 def file_count_to_hex(file_count):
     for i in range(12):
@@ -32,82 +36,64 @@ def fill_to_multiple_of_16(arr, pos):
     
     return arr[:pos] + padding_bytes        
 
-def open_file(file_item):
-    files = {}
-    
+##########################################
+# XPCK/XFSP Reader
+##########################################
+
+# crc32, name offset, offset, size, offset ext, size ext
+XPCKFileInfo = Struct("<IHHHBB")
+
+# unknown, name offset, offset, size, offset ext, size ext
+XFSPFileInfo = Struct("<HHHHBB")
+
+# offset is absolute, index is the position of the record in the file info table
+ArchiveEntry = namedtuple("ArchiveEntry", ["key", "name_offset", "offset", "size", "index"])
+
+def map_archive(file_item):
     if isinstance(file_item, str):
-        # If the input is a filename
+        # If the input is a filename, only the touched pages are read
         with open(file_item, 'rb') as file:
-            data = file.read()
-    elif isinstance(file_item, (bytearray, bytes)):
-        # If the input is a bytearray
-        data = bytes(file_item)
+            return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    elif isinstance(file_item, (bytearray, bytes, memoryview, mmap.mmap)):
+        return memoryview(file_item)
     else:
         raise ValueError("Unsupported input type. Please provide a filename or a bytearray.")
+
+def read_entries(data):
+    magic = bytes(data[:4])
     
-    files = {}
+    if magic == b"XPCK":
+        file_info = XPCKFileInfo
+    elif magic == b"XFSP":
+        file_info = XFSPFileInfo
+    else:
+        raise Exception(f"Unknown xc magic: {magic}")
+    
+    file_count, file_info_offset, file_table_offset, data_offset, file_info_size, filename_table_size = unpack_from("<6H", data, 4)
+    file_count &= 0xFFF
+    file_info_offset *= 4
+    file_table_offset *= 4
+    data_offset *= 4
+    filename_table_size *= 4
+    
+    name_table = compressor.decompress(bytes(data[file_table_offset : file_table_offset + filename_table_size]))
+    
+    # One pass over the whole file info table
+    table = data[file_info_offset : file_info_offset + file_count * file_info.size]
+    records = [ArchiveEntry(key, name_offset, (offset | offset_ext << 16) * 4 + data_offset, size | size_ext << 16, index)
+        for index, (key, name_offset, offset, size, offset_ext, size_ext) in enumerate(file_info.iter_unpack(table))]
+    
+    entries = {}
     
-    magic = data[:4]
     if magic == b"XFSP":
-        file_count = unpack("<H", data[4:6])[0] & 0xFFF
-        file_info_offset = unpack("<H", data[6:8])[0] * 4
-        file_table_offset = unpack("<H", data[8:10])[0] * 4
-        data_offset = unpack("<H", data[10:12])[0] * 4
-        filename_table_size = unpack("<H", data[14:16])[0] * 4
-        
-        name_table = data[file_table_offset : file_table_offset + filename_table_size]
-        name_table = compressor.decompress(name_table)
-        
-        for i in range(file_count):
-            unk = unpack("<H", data[file_info_offset + i * 10 + 0 : file_info_offset + i * 10 + 2])[0]
-            name_offset = unpack("<H", data[file_info_offset + i * 10 + 2: file_info_offset + i * 10 + 4])[0]
-            offset = unpack("<H", data[file_info_offset + i * 10 + 4 : file_info_offset + i * 10 + 6])[0]
-            size = unpack("<H", data[file_info_offset + i * 10 + 6 : file_info_offset + i * 10 + 8])[0]
-            offset_ext = unpack("<B", data[file_info_offset + i * 10 + 8 : file_info_offset + i * 10 + 9])[0]
-            size_ext =  unpack("<B", data[file_info_offset + i * 10 + 9 : file_info_offset + i * 10 + 10])[0]
-            
-            offset |= offset_ext << 16
-            size |= size_ext << 16
-            offset = offset * 4 + data_offset
-            
-            file_data = data[offset : offset + size]
-            
-            # Get name
-            name_length = name_table.find(b'\x00', name_offset)
-            name = name_table[name_offset:name_length].decode("utf-8")
-            
-            files[name] = file_data
-            
-        file_names = list(files.keys())
-        file_names.sort()
-        sorted_files = {i: files[i] for i in file_names}
-        
-        return sorted_files
-    elif magic == b"XPCK":
-        file_count = unpack("<H", data[4:6])[0] & 0xFFF
-        file_info_offset = unpack("<H", data[6:8])[0] * 4
-        file_table_offset = unpack("<H", data[8:10])[0] * 4
-        data_offset = unpack("<H", data[10:12])[0] * 4
-        filename_table_size = unpack("<H", data[14:16])[0] * 4
-        
-        hash_to_data = {}
-        for i in range(file_count):
-            name_crc = unpack("<I", data[file_info_offset + i * 12 : file_info_offset + i * 12 + 4])[0]
-            offset = unpack("<H", data[file_info_offset + i * 12 + 6 : file_info_offset + i * 12 + 8])[0]
-            size = unpack("<H", data[file_info_offset + i * 12 + 8 : file_info_offset + i * 12 + 10])[0]
-            offset_ext = unpack("<B", data[file_info_offset + i * 12 + 10 : file_info_offset + i * 12 + 11])[0]
-            size_ext = unpack("<B", data[file_info_offset + i * 12 + 11 : file_info_offset + i * 12 + 12])[0]
-            
-            offset |= offset_ext << 16
-            size |= size_ext << 16
-            offset = offset * 4 + data_offset
-            
-            file_data = data[offset : offset + size]
-            
-            hash_to_data[name_crc] = file_data
+        for record in records:
+            name_length = name_table.find(b'\x00', record.name_offset)
+            entries[name_table[record.name_offset:name_length].decode("utf-8")] = record
         
-        name_table = data[file_table_offset : file_table_offset + filename_table_size]
-        name_table = compressor.decompress(name_table)
+        entries = {name: entries[name] for name in sorted(entries)}
+    else:
+        hash_to_record = {record.key: record for record in records}
+        hash_dictionary = get_hash_dictionary()
         
         pos = 0
         for i in range(file_count):
@@ -116,81 +102,455 @@ def open_file(file_item):
             pos = name_length + 1
             
             crc = zlib.crc32(name.encode("utf-8"))
-            if crc in hash_to_data:
-                files[name] = hash_to_data[crc]
+            if crc in hash_to_record:
+                entries[name] = hash_to_record[crc]
+                hash_dictionary.add(name, crc)
             else:
                 print("Couldn't find", name, hex(crc))
+    
+    return entries
+
+def open_file_view(file_item):
+    # Entries are memoryview slices of the archive, nothing is copied
+    data = map_archive(file_item)
+    
+    return {name: data[entry.offset : entry.offset + entry.size] for name, entry in read_entries(data).items()}
+
+def open_file(file_item):
+    return {name: bytes(file_data) for name, file_data in open_file_view(file_item).items()}
+
+##########################################
+# Archive
+##########################################
+
+class Archive:
+    # Dict-like view of a XPCK/XFSP, entries are only read when asked for
+    def __init__(self, file_item):
+        self.data = map_archive(file_item)
+        self.entries = read_entries(self.data)
+        self.decompressed = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        return self.raw(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        mapping = self.data.obj
+        self.data.release()
         
-        return files
-    else:
-        raise Exception(f"Unknown xc magic: {magic}")
+        # Views still held by the caller keep the mapping open until they are dropped
+        if isinstance(mapping, mmap.mmap):
+            try:
+                mapping.close()
+            except BufferError:
+                pass
 
-def pack_archive(files, output_file):
-    offset = 0
-    name_offset = 0
+    def names(self):
+        return list(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def items(self):
+        return ((name, self.raw(name)) for name in self.entries)
+
+    def view(self, name):
+        entry = self.entries[name]
+        return self.data[entry.offset : entry.offset + entry.size]
+
+    def raw(self, name):
+        return bytes(self.view(name))
+
+    def info(self, name):
+        entry = self.entries[name]
+        header = bytes(self.data[entry.offset : entry.offset + min(entry.size, 4)])
+        
+        if compressor.is_compressed(header, entry.size):
+            method, decompressed_size = compressor.read_method(header)
+            compression = compressor.METHOD_NAMES[method]
+        else:
+            decompressed_size = entry.size
+            compression = None
+        
+        return {
+            "name": name,
+            "offset": entry.offset,
+            "size": entry.size,
+            "crc": entry.key,
+            "compression": compression,
+            "decompressed_size": decompressed_size,
+        }
+
+    def read(self, name):
+        if name not in self.decompressed:
+            data = self.raw(name)
+            file_data = None
+            
+            if compressor.is_compressed(data):
+                try:
+                    file_data = compressor.decompress(data)
+                except Exception:
+                    file_data = None
+                
+                # Drop what the entry padding decoded to
+                method, decompressed_size = compressor.read_method(data)
+                if file_data:
+                    file_data = file_data[:decompressed_size]
+                else:
+                    file_data = None
+            
+            # Entries that only looked compressed are returned as they are
+            self.decompressed[name] = bytes(file_data) if file_data is not None else data
+        
+        return self.decompressed[name]
+
+    def iter_by_extension(self, *extensions):
+        for name in self.entries:
+            if name.endswith(extensions):
+                yield name
+
+##########################################
+# XPCK/XFSP Writer
+##########################################
+
+def crc16_x25(data):
+    crc = 0xFFFF
     
-    # Sort filename by alphabetic
-    file_names = list(files.keys())
-    file_names.sort()
-    sorted_files = {i: files[i] for i in file_names}
-    files = sorted_files
+    for byte in data:
+        crc ^= byte
+        for i in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
     
-    # Modify the dictionary
-    for key, value in files.items():
-        files[key] = {"data": fill(value), "offset": offset, "name_offset": name_offset}
-        offset += len(fill(value))
-        name_offset += len(key) + 1
+    return crc ^ 0xFFFF
 
-    # Encodes filenames in UTF-8 and compresses them with zlib
-    name_table = b''.join([filename.encode("utf-8") + b'\x00' for filename in list(files.keys())])
-    compressed_name_table = lz10.compress(name_table)
-    compressed_name_table = fill_to_multiple_of_16(compressed_name_table, 12 * len(file_names) + 20 + len(compressed_name_table))
+# File info struct and name hash of each archive type
+ArchiveFormats = {
+    b"XPCK": (XPCKFileInfo, zlib.crc32),
+    b"XFSP": (XFSPFileInfo, crc16_x25),
+}
 
-    # Writes XPCK file header
-    with open(output_file, 'wb') as file:
-        file.write(pack("4s", "XPCK".encode()))
-        file.write(pack("<H", file_count_to_hex(len(files))))
-        file.write(pack("<H", 20 // 4))
-        file.write(pack("<H", (20 + len(files) * 12) // 4))
-        file.write(pack("<H", (20 + len(files) * 12 + len(compressed_name_table)) // 4))
-        file.write(pack("<H", len(files) * 12 // 4))
-        file.write(pack("<H", len(compressed_name_table) // 4))
+def iter_entry_chunks(file_item, chunk_size=1 << 20):
+    if isinstance(file_item, (bytes, bytearray, memoryview)):
+        yield file_item
+    elif isinstance(file_item, str):
+        # If the input is a filename
+        with open(file_item, 'rb') as file:
+            yield from iter(lambda: file.read(chunk_size), b'')
+    else:
+        # Any iterable of chunks
+        yield from file_item
 
-        data_size = 0
-        for data in files.values():
-            data_size += len(data["data"])
+def pack_archive(files, output_file, dedup=False):
+    return write_archive(files, output_file, b"XPCK", dedup)
+
+def pack_xfsp(files, output_file, dedup=False):
+    return write_archive(files, output_file, b"XFSP", dedup)
+
+def write_archive(files, output_file, magic=b"XPCK", dedup=False):
+    # Entries can be bytes, file paths or iterables of chunks, they are streamed to the output
+    # With dedup, identical payloads share one offset, the number of bytes saved is returned
+    file_info, hash_name = ArchiveFormats[magic]
+    
+    file_names = sorted(files)
+    name_crcs = {filename: hash_name(filename.encode("utf-8")) for filename in file_names}
+    
+    name_offsets = {}
+    name_offset = 0
+    for filename in file_names:
+        name_offsets[filename] = name_offset
+        name_offset += len(filename.encode("utf-8")) + 1
+    
+    # Encodes filenames in UTF-8 and compresses them with lz10
+    name_table = b''.join([filename.encode("utf-8") + b'\x00' for filename in file_names])
+    compressed_name_table = lz10.compress(name_table)
+    
+    # The table is padded to 4 bytes, XFSP records are 10 bytes long
+    table_size = (file_info.size * len(file_names) + 3) & ~3
+    compressed_name_table = fill_to_multiple_of_16(compressed_name_table, table_size + 20 + len(compressed_name_table))
+    
+    table_offset = 20
+    name_table_offset = table_offset + table_size
+    data_offset = name_table_offset + len(compressed_name_table)
+    
+    with open(output_file, 'wb') as file:
+        # The header and the file table are written once the entry sizes are known
+        file.write(bytes(name_table_offset))
+        file.write(compressed_name_table)
+        
+        entries = {}
+        offset = 0
+        digests = {}
+        saved_size = 0
+        for filename in file_names:
+            size = 0
+            digest = hashlib.blake2b(digest_size=16)
+            for chunk in iter_entry_chunks(files[filename]):
+                file.write(chunk)
+                size += len(chunk)
+                if dedup:
+                    digest.update(chunk)
+            
+            padding = -size % 16
+            file.write(bytes(padding))
             
+            content_key = (digest.digest(), size)
+            if dedup and content_key in digests:
+                # Already in the archive, drop what was just written
+                file.seek(data_offset + offset)
+                file.truncate()
+                
+                entries[filename] = digests[content_key]
+                saved_size += size + padding
+                continue
+            
+            entries[filename] = (offset, size + padding)
+            digests[content_key] = entries[filename]
+            offset += size + padding
+        
+        file.seek(0)
+        file.write(pack("4s", magic))
+        file.write(pack("<H", file_count_to_hex(len(file_names))))
+        file.write(pack("<H", table_offset // 4))
+        file.write(pack("<H", name_table_offset // 4))
+        file.write(pack("<H", data_offset // 4))
+        file.write(pack("<H", table_size // 4))
+        file.write(pack("<H", len(compressed_name_table) // 4))
         file.write(pack("<I", offset // 4))
+        
+        # Writes file information sorted by name hash
+        for filename in sorted(file_names, key=name_crcs.get):
+            entry_offset, entry_size = entries[filename]
+            shifted_offset = entry_offset >> 2
+            
+            file.write(file_info.pack(
+                name_crcs[filename],
+                name_offsets[filename],
+                shifted_offset & 0xFFFF,
+                entry_size & 0xFFFF,
+                shifted_offset >> 16,
+                entry_size >> 16
+            ))
+    
+    return saved_size
 
-        # Sort file name by crc32
-        key_crc32 = {}
-        for filename in list(files.keys()):
-            key_crc32[zlib.crc32(filename.encode("utf-8"))] = filename
+##########################################
+# XPCK/XFSP Update
+##########################################
 
-        # Writes file information for each file
-        sorted_by_crc32 = sorted(list(files.keys()), key=lambda x: zlib.crc32(x.encode("utf-8")))
-        for filename in sorted_by_crc32:
-            name_crc = zlib.crc32(filename.encode("utf-8"))
+def repack_archive(path, files=None):
+    with Archive(path) as archive:
+        magic = bytes(archive.data[:4])
+        entries = {name: archive.view(name) for name in archive}
+        entries.update(files or {})
+        
+        # Payloads shared by several entries stay shared
+        offsets = [entry.offset for entry in archive.entries.values()]
+        dedup = len(set(offsets)) < len(offsets)
+        
+        temp_path = path + ".tmp"
+        write_archive(entries, temp_path, magic, dedup)
+        
+        del entries
+    
+    os.replace(temp_path, path)
 
-            shifted_offset = files[filename]["offset"] >> 2
-            offset_higher = shifted_offset & 0xFFFF
-            offset_lower = shifted_offset >> 16
+def update_archive(path, files, compact=False):
+    # Entries that fit in their padded slot are patched in place, the others are appended
+    with Archive(path) as archive:
+        magic = bytes(archive.data[:4])
+        file_info_offset, file_table_offset, data_offset = unpack_from("<3H", archive.data, 6)
+        entries = archive.entries
+    
+    if any(name not in entries for name in files):
+        # New names change the name table, the whole archive has to be written again
+        # (with the file closed, Windows can't replace a file that is still open)
+        repack_archive(path, files)
+        return {"patched": [], "appended": [], "repacked": list(files)}
+    
+    with open(path, 'r+b') as file:
+        file_info = XPCKFileInfo if magic == b"XPCK" else XFSPFileInfo
+        file_info_offset *= 4
+        data_offset *= 4
+        
+        file.seek(0, os.SEEK_END)
+        end = file.tell()
+        
+        # A slot goes until the next entry, entries sharing an offset are never patched
+        offsets = sorted(set(entry.offset for entry in entries.values()))
+        slot_ends = dict(zip(offsets, offsets[1:] + [end]))
+        offset_counts = Counter(entry.offset for entry in entries.values())
+        
+        patched = []
+        appended = []
+        
+        for name, file_data in files.items():
+            entry = entries[name]
+            padded_size = len(file_data) + (-len(file_data) % 16)
             
-            file_size = len(files[filename]["data"])
-            size_higher = file_size & 0xFFFF
-            size_lower = file_size >> 16
+            if offset_counts[entry.offset] == 1 and entry.offset + padded_size <= slot_ends[entry.offset]:
+                offset = entry.offset
+                patched.append(name)
+            else:
+                offset = end + (-(end - data_offset) % 16)
+                end = offset + padded_size
+                appended.append(name)
             
-            file.write(pack("<I", name_crc))
-            file.write(pack("<H", files[filename]["name_offset"]))
-            file.write(pack("<H", offset_higher))
-            file.write(pack("<H", size_higher))
-            file.write(pack("<B", offset_lower))
-            file.write(pack("<B", size_lower))
-
-        # Write name table
-        file.write(compressed_name_table)
-
-        # Writes compressed file data
-        for filename in list(files.keys()):
-            file_data = files[filename]["data"]
+            shifted_offset = (offset - data_offset) >> 2
+            if shifted_offset > 0xFFFFFF or padded_size > 0xFFFFFF:
+                raise Exception(f"{name} doesn't fit in the archive")
+            
+            file.seek(offset)
             file.write(file_data)
+            file.write(bytes(padded_size - len(file_data)))
+            
+            file.seek(file_info_offset + entry.index * file_info.size)
+            file.write(file_info.pack(entry.key, entry.name_offset, shifted_offset & 0xFFFF, padded_size & 0xFFFF, shifted_offset >> 16, padded_size >> 16))
+            
+            entries[name] = entry._replace(offset=offset, size=padded_size)
+        
+        # Total data size
+        file.seek(16)
+        file.write(pack("<I", max([entry.offset + entry.size - data_offset for entry in entries.values()] + [0]) // 4))
+    
+    if compact and appended:
+        repack_archive(path)
+    
+    return {"patched": patched, "appended": appended, "repacked": []}
+
+##########################################
+# XPCK/XFSP Verify
+##########################################
+
+def verify_archive(file_item, deep=False, archive_path=""):
+    # Only the header, the tables and the first bytes of each entry are read unless deep is set
+    data = map_archive(file_item)
+    errors = []
+    
+    def error(message):
+        errors.append((archive_path, message))
+        return errors
+    
+    if len(data) < 20:
+        return error("File is smaller than the header")
+    
+    magic = bytes(data[:4])
+    if magic not in ArchiveFormats:
+        return error(f"Unknown xc magic: {magic}")
+    
+    file_info, hash_name = ArchiveFormats[magic]
+    file_count, file_info_offset, file_table_offset, data_offset, file_info_size, filename_table_size = unpack_from("<6H", data, 4)
+    data_size = unpack_from("<I", data, 16)[0] * 4
+    file_count &= 0xFFF
+    file_info_offset *= 4
+    file_table_offset *= 4
+    data_offset *= 4
+    filename_table_size *= 4
+    
+    # Table bounds
+    if file_info_offset < 20 or file_info_offset + file_count * file_info.size > file_table_offset:
+        return error("File info table overlaps the header or the name table")
+    if file_table_offset + filename_table_size > data_offset:
+        return error("Name table overlaps the data")
+    if data_offset > len(data):
+        return error("Data offset is past the end of the file")
+    if data_offset + data_size > len(data):
+        error(f"Data size {data_size} goes past the end of the file")
+    
+    try:
+        name_table = compressor.decompress(bytes(data[file_table_offset : file_table_offset + filename_table_size]))
+    except Exception as e:
+        name_table = None
+    if not name_table:
+        return error("Name table can't be decompressed")
+    
+    table = data[file_info_offset : file_info_offset + file_count * file_info.size]
+    records = list(file_info.iter_unpack(table))
+    
+    # Name table and hash agreement
+    if magic == b"XPCK":
+        names = [name.decode("utf-8", "replace") for name in name_table.split(b'\x00')[:file_count]]
+        name_hashes = {hash_name(name.encode("utf-8")): name for name in names}
+        
+        if len(names) != file_count:
+            error(f"Name table has {len(names)} names for {file_count} files")
+        
+        record_keys = set(record[0] for record in records)
+        for name in names:
+            if hash_name(name.encode("utf-8")) not in record_keys:
+                error(f"{name} has no file info")
+    else:
+        name_hashes = {}
+    
+    entries = []
+    for key, name_offset, offset, size, offset_ext, size_ext in records:
+        offset = (offset | offset_ext << 16) * 4 + data_offset
+        size = size | size_ext << 16
+        
+        if magic == b"XPCK":
+            name = name_hashes.get(key)
+            if name is None:
+                error(f"File info {key:08X} has no name")
+                name = f"0x{key:08X}"
+        else:
+            name_end = name_table.find(b'\x00', name_offset)
+            if name_offset >= len(name_table) or name_end < 0:
+                error(f"Name offset {name_offset} is outside of the name table")
+                name = f"0x{name_offset:04X}"
+            else:
+                name = name_table[name_offset:name_end].decode("utf-8", "replace")
+        
+        # Size consistency
+        if offset + size > len(data):
+            error(f"{name} goes past the end of the file")
+            continue
+        if offset + size > data_offset + data_size:
+            error(f"{name} goes past the data size of the header")
+        
+        entries.append((name, offset, size))
+    
+    # Entries can share their data but never overlap
+    sorted_entries = sorted(set((offset, size) for name, offset, size in entries))
+    for (offset, size), (next_offset, next_size) in zip(sorted_entries, sorted_entries[1:]):
+        if offset + size > next_offset:
+            error(f"Entries at 0x{offset:X} and 0x{next_offset:X} overlap")
+    
+    for name, offset, size in entries:
+        entry_path = archive_path + "/" + name
+        header = bytes(data[offset : offset + min(size, 4)])
+        
+        # Entries that must be compressed or must be archives
+        if name == "RES.bin" and not compressor.is_compressed(header, size):
+            errors.append((entry_path, "Compression header is invalid"))
+        
+        if name.endswith(('.xc', '.xv')) and size > 0:
+            if header not in ArchiveFormats:
+                errors.append((entry_path, f"Unknown xc magic: {header}"))
+            elif deep:
+                errors.extend(verify_archive(data[offset : offset + size], deep, entry_path))
+        elif deep and compressor.is_compressed(header, size):
+            method, decompressed_size = compressor.read_method(header)
+            
+            try:
+                file_data = compressor.decompress(bytes(data[offset : offset + size]))
+            except Exception as e:
+                file_data = None
+            
+            # The padding of the entry can decode to a few more bytes
+            if file_data is None or file_data is False or len(file_data) < decompressed_size:
+                errors.append((entry_path, f"{compressor.METHOD_NAMES[method]} data doesn't decompress to {decompressed_size} bytes"))
+    
+    return errors
@@ -0,0 +1,170 @@
+import io
+import os
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from . import xpck, xmpr, imgc, res, minf, xcma, xcmt, txp, animation_manager
+from ..utils.process_pool import get_jobs, make_process_pool
+
+##########################################
+# Entry Types
+##########################################
+
+ARCHIVE_EXTENSIONS = ('.xc', '.xv')
+
+# Parsers that need neither mathutils (BONE) nor the shared hash dictionary (RES) run in worker processes
+PROCESS_ENTRY_TYPES = ('MESH', 'TEXTURE', 'CAMERA', 'ANIMATION', 'SPLIT_ANIMATION', 'SPLIT_ANIMATIONS', 'CAMERA_HASHES', 'TEXPROJ')
+
+# Below this many bytes of such entries, starting the workers costs more than it saves
+PARALLEL_MIN_SIZE = 1 << 20
+
+def get_entry_type(name):
+    if name.endswith(ARCHIVE_EXTENSIONS):
+        return 'ARCHIVE'
+    elif name.endswith('.prm'):
+        return 'MESH'
+    elif name.endswith('.mbn'):
+        return 'BONE'
+    elif name.endswith('.xi'):
+        return 'TEXTURE'
+    elif name.endswith('.cmr2'):
+        return 'CAMERA'
+    elif name.endswith('.mtn2') or name.endswith('.imm2') or name.endswith('.mtm2'):
+        return 'ANIMATION'
+    elif name.endswith('mtninf') and not name.endswith('.mtninf2'):
+        return 'SPLIT_ANIMATION'
+    elif name.endswith('.mtninf2'):
+        return 'SPLIT_ANIMATIONS'
+    elif name == 'RES.bin':
+        return 'RES'
+    elif name == 'CMR.bin':
+        return 'CAMERA_HASHES'
+    elif name.endswith('.txp'):
+        return 'TEXPROJ'
+    else:
+        return 'RAW'
+
+def parse_entry(entry_type, data, texture_lod=0, texture_cache=None):
+    if entry_type == 'MESH':
+        return xmpr.open_xmpr(io.BytesIO(data))
+    elif entry_type == 'BONE':
+        # mbn needs mathutils, only import it when there is a bone to read
+        from . import mbn
+        return mbn.open(data)
+    elif entry_type == 'TEXTURE':
+        return imgc.open(data, texture_lod, texture_cache)
+    elif entry_type == 'CAMERA':
+        return xcma.open(data)
+    elif entry_type == 'ANIMATION':
+        return animation_manager.AnimationManager(reader=io.BytesIO(data))
+    elif entry_type == 'SPLIT_ANIMATION':
+        return minf.open_minf1(data)
+    elif entry_type == 'SPLIT_ANIMATIONS':
+        return minf.open_minf2(data)
+    elif entry_type == 'RES':
+        return res.open_res(data=data)
+    elif entry_type == 'CAMERA_HASHES':
+        return xcmt.open(data=data)
+    elif entry_type == 'TEXPROJ':
+        return txp.read_txp(io.BytesIO(data))
+    else:
+        return None
+
+##########################################
+# Extraction
+##########################################
+
+def walk_archive(archive, archive_path, index, errors):
+    entries = {}
+
+    for name in archive.names():
+        entry_type = get_entry_type(name)
+        entry_path = archive_path + "/" + name
+
+        entries[entry_path] = {
+            "archive": archive_path,
+            "name": name,
+            "type": entry_type,
+            "value": None,
+            "error": None,
+        }
+
+        if entry_type == 'ARCHIVE':
+            # Nested archives come first so children are listed before their parent
+            try:
+                walk_archive(xpck.Archive(archive.view(name)), entry_path, index, errors)
+            except Exception as e:
+                entries[entry_path]["error"] = str(e)
+                errors.append((entry_path, str(e)))
+        elif entry_type != 'RAW':
+            entries[entry_path]["data"] = archive.raw(name)
+
+    index.update(entries)
+
+def parse_now(entry_type, data, texture_lod=0, texture_cache=None):
+    future = Future()
+
+    try:
+        future.set_result(parse_entry(entry_type, data, texture_lod, texture_cache))
+    except Exception as e:
+        future.set_exception(e)
+
+    return future
+
+def extract_archive(file_item, archive_name=None, texture_lod=0, texture_cache=None, jobs=None):
+    # Returns a flat index {"parent.xc/child.xv/file.prm": entry} and the list of (path, error)
+    if archive_name is None:
+        archive_name = os.path.basename(file_item) if isinstance(file_item, str) else "archive"
+
+    index = {}
+    errors = []
+
+    walk_archive(xpck.Archive(file_item), archive_name, index, errors)
+
+    pending = {entry_path: entry.pop("data") for entry_path, entry in index.items() if "data" in entry}
+    parallel = [entry_path for entry_path in pending if index[entry_path]["type"] in PROCESS_ENTRY_TYPES]
+
+    executor = None
+    if get_jobs(jobs) > 1 and sum(len(pending[entry_path]) for entry_path in parallel) >= PARALLEL_MIN_SIZE:
+        executor = make_process_pool(jobs)
+
+    try:
+        futures = {}
+
+        # The workers start on their entries while the others are parsed here
+        if executor is not None:
+            for entry_path in parallel:
+                futures[entry_path] = executor.submit(parse_entry, index[entry_path]["type"], pending[entry_path], texture_lod, texture_cache)
+
+        for entry_path, data in pending.items():
+            if entry_path not in futures:
+                futures[entry_path] = parse_now(index[entry_path]["type"], data, texture_lod, texture_cache)
+
+        for entry_path, entry in index.items():
+            future = futures.get(entry_path)
+
+            if future is not None:
+                try:
+                    try:
+                        entry["value"] = future.result()
+                    except BrokenProcessPool:
+                        # Workers that couldn't start, parse the entry here instead
+                        entry["value"] = parse_entry(entry["type"], pending[entry_path], texture_lod, texture_cache)
+                except Exception as e:
+                    entry["error"] = str(e)
+                    errors.append((entry_path, str(e)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return index, errors
+
+def group_by_archive(index):
+    # Archives in the order of the index, nested archives before their parent
+    archives = {}
+
+    for entry_path, entry in index.items():
+        archives.setdefault(entry["archive"], []).append(entry)
+
+    return archives
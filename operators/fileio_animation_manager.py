@@ -11,6 +11,7 @@ from bpy.props import StringProperty, EnumProperty, BoolProperty, CollectionProp
 
 from ..animation import *
 from ..formats import  animation_manager, animation_support, res
+from ..utils.hash_dictionary import get_hash_dictionary
 
 ##########################################
 # XMTN Function
@@ -29,8 +30,14 @@ def crc32_hash(name):
 
 def findCrc32(crc32, bones=None, modifier=None, mesh=None):
     if bones:
+        # Names already seen are found without hashing every bone
+        name = get_hash_dictionary().get(crc32)
+        if name is not None and bones.get(name) is not None:
+            return name
+        
         for bone in bones.items():
             if crc32_hash(bone[0]) == crc32:
+                get_hash_dictionary().add(bone[0], crc32)
                 return bone[0]
     if modifier:
         for uvmap in modifier.items():
@@ -2,8 +2,9 @@ import io
 import os
 
 import bpy
+import numpy as np
 from bpy_extras.io_utils import ExportHelper, ImportHelper
-from bpy.props import StringProperty, EnumProperty
+from bpy.props import StringProperty, EnumProperty, BoolProperty
 
 import bmesh
 
@@ -18,148 +19,144 @@ from ..utils.mesh_faces_utils import MeshFaceUtils
 # XMPR Function
 ##########################################
 
+VERTEX_LAYOUT_ITEMS = [
+    ("FLOAT", "Float", "Every attribute as floats, 88 bytes per vertex"),
+    ("COMPACT", "Compact", "Positions and UVs as shorts, normals, weights, bone indices and colors as bytes, unused attributes dropped"),
+]
+
+STRIP_EFFORT_ITEMS = [
+    ("GREEDY", "Greedy", "Grow one strip at a time, fastest"),
+    ("LOW", "Low", "Try 3 strip experiments per pass"),
+    ("MEDIUM", "Medium", "Try 9 strip experiments per pass"),
+    ("FULL", "Full", "Try 30 strip experiments per pass, fewest strips"),
+]
+
 def get_bone_names(armature):
     for bone in armature.pose.bones:
         yield(bone.name)
 
-def get_mesh_info_and_weights(mesh, bone_names=None):
-    vertex_map = {}
-    vertices_info = []
-    uv_info = []
-    normal_info = []
-    color_info = []
-    face_indices = []
+def get_float_array(collection, attribute, count, width):
+    data = np.empty(count * width, dtype=np.float32)
+    collection.foreach_get(attribute, data)
+    return data.reshape(count, width)
 
+def get_mesh_info_and_weights(mesh, bone_names=None):
     if not mesh or not mesh.data:
-        return face_indices, vertices_info, uv_info, normal_info, color_info, {}
+        return [], [], [], [], [], {}
 
     # Ensure the mesh data is in the correct state
     mesh.data.update()
-    
-    # Get blender version
-    blender_version = bpy.app.version
-            
-    # Get vertex colors
-    has_vertex_colors = hasattr(mesh.data, 'vertex_colors') and mesh.data.vertex_colors and mesh.data.vertex_colors.active
-    if has_vertex_colors:
-        vertex_colors = mesh.data.vertex_colors.active.data
+    mesh.data.calc_loop_triangles()
 
-    # Get UVs
-    has_uv_layers = False
-    uv_data = None
-    if hasattr(mesh.data, 'uv_layers') and mesh.data.uv_layers:
-        if mesh.data.uv_layers.active:
-            has_uv_layers = True
-            uv_data = mesh.data.uv_layers.active.data
-        elif len(mesh.data.uv_layers) > 0:
-            # Take first UV layer if none is active
-            has_uv_layers = True
-            uv_data = mesh.data.uv_layers[0].data
-
-    vertex_to_unique_indices = {}
-    
-    # Bone indices mapping
-    bone_indices = {name: i for i, name in enumerate(bone_names)} if bone_names else {}
-    
-    weights = {}
+    vertex_count = len(mesh.data.vertices)
+    loop_count = len(mesh.data.loops)
+    triangle_count = len(mesh.data.loop_triangles)
 
-    for face in mesh.data.polygons:
-        face_idx = []
-        for loop_index in face.loop_indices:
-            vertex_index = mesh.data.loops[loop_index].vertex_index
+    if triangle_count == 0:
+        return [], [], [], [], [], {}
 
-            # Get vertex
-            v = tuple(round(coord, 3) for coord in mesh.data.vertices[vertex_index].co)
-            
-            # Get normals according to the Blender version
-            if blender_version >= (4, 1, 0):
-                # Blender 4.1+: uses corner_normals to be more precise
-                n = tuple(round(coord, 3) for coord in mesh.data.corner_normals[loop_index].vector)
-            else:
-                # Blender 4.0 and previous: use vertex normal
-                n = tuple(round(coord, 3) for coord in mesh.data.vertices[vertex_index].normal)
-            
-            # Get UV
-            if has_uv_layers and uv_data:
-                try:
-                    uv = tuple(round(coord, 3) for coord in uv_data[loop_index].uv)
-                except (IndexError, AttributeError):
-                    uv = (0.0, 0.0)
-            else:
-                uv = (0.0, 0.0)
-                
-            # Get Color
-            if has_vertex_colors and vertex_colors:
-                try:
-                    color = tuple(round(c, 3) for c in vertex_colors[loop_index].color)
-                except (IndexError, AttributeError):
-                    color = (0.0, 0.0, 0.0, 1.0)
-            else:
-                color = (0.0, 0.0, 0.0, 1.0)
+    triangles = np.empty(triangle_count * 3, dtype=np.int32)
+    mesh.data.loop_triangles.foreach_get("loops", triangles)
 
-            key = (v, n, uv, color)
+    loop_vertices = np.empty(loop_count, dtype=np.int32)
+    mesh.data.loops.foreach_get("vertex_index", loop_vertices)
 
-            if key not in vertex_map:
-                unique_index = len(vertex_map)
-                vertex_map[key] = unique_index
-                vertices_info.append(v)
-                normal_info.append(n)
-                uv_info.append(uv)
-                color_info.append(color)
+    positions = get_float_array(mesh.data.vertices, "co", vertex_count, 3)[loop_vertices]
 
-                if vertex_index not in vertex_to_unique_indices:
-                    vertex_to_unique_indices[vertex_index] = []
-                vertex_to_unique_indices[vertex_index].append(unique_index)
-            else:
-                unique_index = vertex_map[key]
-                if vertex_index not in vertex_to_unique_indices:
-                    vertex_to_unique_indices[vertex_index] = []
-                if unique_index not in vertex_to_unique_indices[vertex_index]:
-                    vertex_to_unique_indices[vertex_index].append(unique_index)
-
-            face_idx.append(unique_index)
-        face_indices.append(tuple(face_idx))
-
-    # Harmonize normals and UVs for faces with same positions
-    position_map = {}
-    for face_idx, face in enumerate(face_indices):
-        positions = tuple(sorted([vertices_info[vertex_idx] for vertex_idx in face]))
-        if positions not in position_map:
-            position_map[positions] = []
-        position_map[positions].append(face_idx)
-
-    for positions, face_list in position_map.items():
-        if len(face_list) > 1:
-            ref_face = face_indices[face_list[0]]
-            for face_idx in face_list[1:]:
-                current_face = face_indices[face_idx]
-                vertex_correspondence = {}
-                for i, current_vertex_idx in enumerate(current_face):
-                    current_pos = vertices_info[current_vertex_idx]
-                    for j, ref_vertex_idx in enumerate(ref_face):
-                        if current_pos == vertices_info[ref_vertex_idx]:
-                            vertex_correspondence[current_vertex_idx] = ref_vertex_idx
-                            break
-                for current_vertex_idx, ref_vertex_idx in vertex_correspondence.items():
-                    normal_info[current_vertex_idx] = normal_info[ref_vertex_idx]
-                    uv_info[current_vertex_idx] = uv_info[ref_vertex_idx]
+    # Get normals according to the Blender version
+    if bpy.app.version >= (4, 1, 0):
+        # Blender 4.1+: uses corner_normals to be more precise
+        normals = get_float_array(mesh.data.corner_normals, "vector", loop_count, 3)
+    else:
+        # Blender 4.0 and previous: use vertex normal
+        normals = get_float_array(mesh.data.vertices, "normal", vertex_count, 3)[loop_vertices]
+
+    # Get UVs, take first UV layer if none is active
+    uv_layer = None
+    if hasattr(mesh.data, 'uv_layers') and mesh.data.uv_layers:
+        uv_layer = mesh.data.uv_layers.active or mesh.data.uv_layers[0]
+
+    if uv_layer:
+        uvs = get_float_array(uv_layer.data, "uv", loop_count, 2)
+    else:
+        uvs = np.zeros((loop_count, 2), dtype=np.float32)
+
+    # Get vertex colors
+    if hasattr(mesh.data, 'vertex_colors') and mesh.data.vertex_colors and mesh.data.vertex_colors.active:
+        colors = get_float_array(mesh.data.vertex_colors.active.data, "color", loop_count, 4)
+    else:
+        colors = np.tile(np.array([0.0, 0.0, 0.0, 1.0], dtype=np.float32), (loop_count, 1))
+
+    # Weld loops sharing position, normal, UV and color at 3 decimals, in order of first use
+    quantized = np.rint(np.hstack((positions, normals, uvs, colors)).astype(np.float64) * 1000).astype(np.int64)
+    keys, first_loops, loop_unique = np.unique(quantized, axis=0, return_index=True, return_inverse=True)
+
+    order = np.argsort(first_loops)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    unique_data = keys[order] / 1000
+    unique_loops = first_loops[order]
+    face_indices = rank[loop_unique.reshape(-1)][triangles].reshape(-1, 3)
+
+    vertices_info = unique_data[:, 0:3]
+    normal_info = unique_data[:, 3:6]
+    uv_info = unique_data[:, 6:8]
+    color_info = unique_data[:, 8:12]
+
+    # Harmonize normals and UVs for faces with same positions: every face takes them from
+    # the first face of its group, vertex by vertex through the matching position
+    position_ids = np.unique(vertices_info, axis=0, return_inverse=True)[1].reshape(-1)
+    face_positions = position_ids[face_indices]
+    first_faces, face_groups = np.unique(np.sort(face_positions, axis=1), axis=0, return_index=True, return_inverse=True)[1:]
+
+    reference_faces = first_faces[face_groups.reshape(-1)]
+    harmonized = reference_faces != np.arange(len(face_indices))
+
+    if np.any(harmonized):
+        current = face_indices[harmonized]
+        reference = face_indices[reference_faces[harmonized]]
+        corners = np.argmax(face_positions[harmonized][:, :, None] == position_ids[reference][:, None, :], axis=2)
+        sources = np.take_along_axis(reference, corners, axis=1)
+
+        normal_info = normal_info.copy()
+        uv_info = uv_info.copy()
+        normal_info[current.ravel()] = normal_info[sources.ravel()]
+        uv_info[current.ravel()] = uv_info[sources.ravel()]
 
     # Calculate weights if bone_names provided
+    weights = {}
     if bone_names:
-        for original_vertex_index, unique_indices in vertex_to_unique_indices.items():
-            vertex = mesh.data.vertices[original_vertex_index]
-            vertex_weights = {}
-            for group in vertex.groups:
-                if group.weight != 0:
-                    bone_name = mesh.vertex_groups[group.group].name
-                    bone_index = bone_indices.get(bone_name)
-                    if bone_index is not None:
-                        vertex_weights[bone_index] = group.weight
-            for unique_index in unique_indices:
-                weights[unique_index] = vertex_weights.copy()
-
-    return face_indices, vertices_info, uv_info, normal_info, color_info, weights
+        bone_indices = {name: i for i, name in enumerate(bone_names)}
+        group_bones = {group.index: bone_indices[group.name] for group in mesh.vertex_groups if group.name in bone_indices}
+
+        vertex_weights = {}
+        for unique_index, vertex_index in enumerate(loop_vertices[unique_loops].tolist()):
+            if vertex_index not in vertex_weights:
+                vertex_weights[vertex_index] = {
+                    group_bones[group.group]: group.weight
+                    for group in mesh.data.vertices[vertex_index].groups
+                    if group.weight != 0 and group.group in group_bones
+                }
+            weights[unique_index] = vertex_weights[vertex_index].copy()
+
+    return (
+        [tuple(face) for face in face_indices.tolist()],
+        [tuple(v) for v in vertices_info.tolist()],
+        [tuple(uv) for uv in uv_info.tolist()],
+        [tuple(n) for n in normal_info.tolist()],
+        [tuple(color) for color in color_info.tolist()],
+        weights,
+    )
     
+def get_loop_values(values, loop_vertices):
+    # Per vertex values spread over the loops, loops of vertices past the end are zeros
+    values = np.asarray(values, dtype=np.float32)
+    loop_values = np.zeros((len(loop_vertices), values.shape[1]), dtype=np.float32)
+    valid = loop_vertices < len(values)
+    loop_values[valid] = values[loop_vertices[valid]]
+    return loop_values.ravel()
+
 def make_mesh(model_data, armature=None, bones=None, lib=None, txp_data=None):
     mesh = bpy.data.meshes.new(name=model_data['name'])
     mesh_obj = bpy.data.objects.new(name=model_data['name'], object_data=mesh)
@@ -185,9 +182,23 @@ def make_mesh(model_data, armature=None, bones=None, lib=None, txp_data=None):
     mesh.level5_properties.draw_priority = draw_priority
     mesh.level5_properties.mesh_type = mesh_type
     
-    mesh.from_pydata(positions, [], model_data["triangles"])  
+    triangles = np.asarray(model_data["triangles"], dtype=np.int32).reshape(-1, 3)
+    loop_vertices = triangles.ravel()
+    
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", np.asarray(positions, dtype=np.float32).ravel())
+    mesh.loops.add(len(loop_vertices))
+    mesh.loops.foreach_set("vertex_index", loop_vertices)
+    mesh.polygons.add(len(triangles))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, len(loop_vertices), 3, dtype=np.int32))
     
-    if normals:
+    # loop_total is read-only since Blender 4.0
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set("loop_total", np.full(len(triangles), 3, dtype=np.int32))
+        
+    mesh.update(calc_edges=True)
+    
+    if len(normals):
         #mesh.use_auto_smooth = True
         #mesh.auto_smooth_angle = 180
         mesh.normals_split_custom_set_from_vertices(normals)
@@ -201,33 +212,21 @@ def make_mesh(model_data, armature=None, bones=None, lib=None, txp_data=None):
             if txp[1] == model_data["material_name"]:
                 texprojs[txp[2]] = txp[0]
     
-    if uv_data0:
+    if len(uv_data0):
         uv_layer0 = mesh.uv_layers.new(name=texprojs[0])
-        for loop in mesh.loops:
-            vertex_index = loop.vertex_index
-            if vertex_index < len(uv_data0):
-                uv_layer0.data[loop.index].uv = uv_data0[vertex_index]
+        uv_layer0.data.foreach_set("uv", get_loop_values(uv_data0, loop_vertices))
         mesh_obj.modifiers.new(name=texprojs[0], type="UV_WARP")
         mesh_obj.modifiers[texprojs[0]].uv_layer = texprojs[0]
         
-    if uv_data1:
+    if len(uv_data1):
         uv_layer1 = mesh.uv_layers.new(name=texprojs[1])
-        for loop in mesh.loops:
-            vertex_index = loop.vertex_index
-            if vertex_index < len(uv_data1):
-                uv_layer1.data[loop.index].uv = uv_data1[vertex_index]
+        uv_layer1.data.foreach_set("uv", get_loop_values(uv_data1, loop_vertices))
         mesh_obj.modifiers.new(name=texprojs[1], type="UV_WARP")
         mesh_obj.modifiers[texprojs[1]].uv_layer = texprojs[1]
 
-    if color_data:
+    if len(color_data):
         color_layer = mesh.vertex_colors.new(name="Col")
-        flat_colors = []
-        
-        for loop in mesh.loops:
-            vert_idx = loop.vertex_index
-            flat_colors.extend(color_data[vert_idx])  # r, g, b, a
-
-        color_layer.data.foreach_set("color", flat_colors)
+        color_layer.data.foreach_set("color", get_loop_values(color_data, loop_vertices))  # r, g, b, a
     
     mesh_obj.rotation_euler = (radians(90), 0, 0)
     
@@ -240,10 +239,8 @@ def make_mesh(model_data, armature=None, bones=None, lib=None, txp_data=None):
                 if bone_name not in mesh_obj.vertex_groups:
                     mesh_obj.vertex_groups.new(name=bone_name)
             
-            for vert_idx, (vertex_weights, vertex_bones) in enumerate(zip(weights, bone_indices)):
-                for weight, bone_idx in zip(vertex_weights, vertex_bones):
-                    bone_name = bones[bone_idx]
-                    mesh_obj.vertex_groups[bone_name].add([vert_idx], weight, 'ADD')
+            for bone_idx, weight, vertices in xmpr.get_weight_batches(weights, bone_indices):
+                mesh_obj.vertex_groups[bones[bone_idx]].add(vertices, weight, 'REPLACE')
         
         #if mesh_obj.vertex_groups:
             #bone_influences = {bone.name: 0.0 for bone in armature.data.bones}
@@ -351,7 +348,7 @@ def make_mesh(model_data, armature=None, bones=None, lib=None, txp_data=None):
     
     return mesh_obj
 
-def fileio_write_xmpr(context, mesh_name, library_name, mode):
+def fileio_write_xmpr(operator, context, mesh_name, library_name, mode, vertex_layout="FLOAT", strip_effort="FULL", optimize_cache=False):
     mesh = bpy.data.objects[mesh_name]
 
     bone_names = []
@@ -362,9 +359,13 @@ def fileio_write_xmpr(context, mesh_name, library_name, mode):
 
     # Cancel if mesh info is empty
     if not (indices or vertices or uvs or normals or colors):
-        self.report({'ERROR'}, f"Mesh {mesh_name} has invalid or empty data, export canceled")
+        operator.report({'ERROR'}, f"Mesh {mesh_name} has invalid or empty data, export canceled")
         return {'CANCELLED'}
 
+    if optimize_cache:
+        (indices, vertices, uvs, normals, colors, weights), (acmr_before, acmr_after) = xmpr.optimize_mesh(indices, vertices, uvs, normals, colors, weights)
+        operator.report({'INFO'}, f"{mesh_name}: vertex cache ACMR {acmr_before:.3f} -> {acmr_after:.3f}")
+
     single_bind = None
     if mesh.parent_type == 'BONE' and mesh.parent_bone:
         single_bind = mesh.parent_bone
@@ -381,10 +382,11 @@ def fileio_write_xmpr(context, mesh_name, library_name, mode):
         mesh.name_full, texspace_array,
         indices, vertices, uvs, normals, colors,
         weights, bone_names, library_name, mode,
-        single_bind, draw_priority, mesh_type
+        single_bind, draw_priority, mesh_type,
+        vertex_layout, strip_effort
     )
     
-def fileio_open_xmpr(context, filepath):
+def fileio_open_xmpr(operator, context, filepath):
     # Extract the file name without extension
     file_name = os.path.splitext(os.path.basename(filepath))[0]
 
@@ -392,6 +394,9 @@ def fileio_open_xmpr(context, filepath):
         # Open the XMPR file and read model data
         mesh_data = xmpr.open_xmpr(io.BytesIO(file.read()))
 
+        for warning in mesh_data["warnings"]:
+            operator.report({'WARNING'}, f"{file_name}: {warning}")
+
         # Create the mesh using the model data
         make_mesh(mesh_data)
 
@@ -467,6 +472,26 @@ class ExportXPRM(bpy.types.Operator, ExportHelper):
         description="Write a material name",
         default="",
     )    
+    
+    vertex_layout: EnumProperty(
+        name="Vertex Layout",
+        description="Choose how the vertex attributes are stored",
+        items=VERTEX_LAYOUT_ITEMS,
+        default="FLOAT",
+    )
+    
+    strip_effort: EnumProperty(
+        name="Strip Effort",
+        description="Choose how hard the triangle strips are optimized",
+        items=STRIP_EFFORT_ITEMS,
+        default="FULL",
+    )
+    
+    optimize_cache: BoolProperty(
+        name="Optimize Vertex Cache",
+        description="Reorder triangles and vertices for the post-transform vertex cache. Helps Greedy strips and triangle lists, the other strip efforts already give a near optimal order",
+        default=False,
+    )
 
     def execute(self, context):
         if not self.mesh_name:
@@ -484,7 +509,7 @@ class ExportXPRM(bpy.types.Operator, ExportHelper):
         with open(self.filepath, "wb") as f:
             template = get_template_by_name(self.template_name)
             mode = template.modes[self.template_mode_name]
-            f.write(fileio_write_xmpr(context, self.mesh_name, self.material_name, mode))
+            f.write(fileio_write_xmpr(self, context, self.mesh_name, self.material_name, mode, self.vertex_layout, self.strip_effort, self.optimize_cache))
             return {'FINISHED'}
 
     def invoke(self, context, event):
@@ -500,4 +525,4 @@ class ImportXMPR(bpy.types.Operator, ImportHelper):
     filter_glob: StringProperty(default="*.prm", options={'HIDDEN'})
     
     def execute(self, context):
-            return fileio_open_xmpr(context, self.filepath)            
+            return fileio_open_xmpr(self, context, self.filepath)            
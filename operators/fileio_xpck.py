@@ -11,12 +11,14 @@ import bmesh
 from math import radians
 from mathutils import Matrix, Quaternion, Vector
 
-from ..formats import xmpr, xpck, mbn, imgc, res, minf, xcsl, xcma, xcmt, cmn, txp, animation_manager, animation_support
+from ..formats import xmpr, xpck, xpck_extract, mbn, imgc, res, minf, xcsl, xcma, xcmt, cmn, txp, animation_manager, animation_support
 from .fileio_xmpr import *
 from .fileio_animation_manager import *
 from .fileio_xcma import *
 from ..utils.img_format import *
 from ..utils.img_tool import *
+from ..utils.img_cache import TextureCache
+from ..utils.hash_dictionary import get_hash_dictionary
 from ..utils.properties import *
 from ..templates import *
 from ..controls import CameraElevenObject
@@ -141,16 +143,50 @@ def setup_nla_tracks(mesh=None, armature=None):
     # Play the animation
     bpy.ops.screen.animation_play()
 
-def fileio_open_xpck(context, filepath, file_name = ""):
-    scene = bpy.context.scene
-    
-    archive = xpck.open_file(filepath)
-    
+def save_hash_dictionary(operator):
+    # The dictionary is only a cache in the home folder, failing to write it doesn't fail the import or export
+    try:
+        get_hash_dictionary().save()
+    except OSError as e:
+        operator.report({'WARNING'}, f"Couldn't save the hash dictionary: {e}")
+
+def fileio_open_xpck(operator, context, filepath, file_name = "", texture_lod = 0, texture_cache = None):
     if file_name == '':
         archive_name = os.path.splitext(os.path.basename(filepath))[0]
     else:
         archive_name = file_name
     
+    # Every nested archive is parsed at once into a flat index, large ones in worker processes
+    root_path = os.path.basename(filepath) if isinstance(filepath, str) else file_name
+    index, errors = xpck_extract.extract_archive(filepath, root_path, texture_lod, texture_cache)
+    
+    for error_path, error in errors:
+        print("Couldn't read", error_path, error)
+    
+    for entry_path, entry in index.items():
+        if entry["type"] == 'MESH' and entry.get("value"):
+            for warning in entry["value"]["warnings"]:
+                operator.report({'WARNING'}, f"{entry_path}: {warning}")
+    
+    result = {'FINISHED'}
+    
+    for archive_path, entries in xpck_extract.group_by_archive(index).items():
+        if archive_path == root_path:
+            result = make_archive(context, archive_name, entries)
+        else:
+            try:
+                make_archive(context, os.path.basename(archive_path), entries)
+            except Exception as e:
+                print("Couldn't import", archive_path, e)
+    
+    # Keep the names read from this archive for the next imports
+    save_hash_dictionary(operator)
+    
+    return result
+
+def make_archive(context, archive_name, entries):
+    scene = bpy.context.scene
+    
     libs = {}
     armature = None
     res_data = None
@@ -164,29 +200,30 @@ def fileio_open_xpck(context, filepath, file_name = ""):
     animations_split_data = []
     txp_data = []
     
-    for file_name in archive:
-        if file_name.endswith('.xc') or file_name.endswith('.xv'):
-            try:
-                fileio_open_xpck(context, archive[file_name], file_name)
-            except Exception as e:
-                pass
-        elif file_name.endswith('.prm'):
-            meshes_data.append(xmpr.open_xmpr(io.BytesIO(archive[file_name])))
-        elif file_name.endswith('.mbn'):
-            bones_data.append(mbn.open(archive[file_name]))    
-        elif file_name.endswith('.xi'):
-            textures_data.append(imgc.open(archive[file_name]))
-        elif file_name.endswith('.cmr2'):
-            hash_name, cam_values = xcma.open(archive[file_name])
+    for entry in entries:
+        entry_type = entry['type']
+        value = entry['value']
+        
+        if entry['error'] is not None:
+            # Keep the textures aligned with the RES texture list
+            if entry_type == 'TEXTURE':
+                textures_data.append(None)
+        elif entry_type == 'MESH':
+            meshes_data.append(value)
+        elif entry_type == 'BONE':
+            bones_data.append(value)
+        elif entry_type == 'TEXTURE':
+            textures_data.append(value)
+        elif entry_type == 'CAMERA':
+            hash_name, cam_values = value
             camera_data[hash_name] = cam_values
-        elif file_name.endswith('.mtn2') or file_name.endswith('.imm2') or file_name.endswith('.mtm2'):
-            print(file_name)
-            anim = animation_manager.AnimationManager(reader=io.BytesIO(archive[file_name]))
-            animations_data.append(anim)
-        elif file_name.endswith('mtninf') and not file_name.endswith('.mtninf2'):
+        elif entry_type == 'ANIMATION':
+            print(entry['name'])
+            animations_data.append(value)
+        elif entry_type == 'SPLIT_ANIMATION':
             split_animation_data = {}
             
-            split_anim_crc32, split_anim_name, anim_crc32, frame_start, frame_end = minf.open_minf1(archive[file_name])
+            split_anim_crc32, split_anim_name, anim_crc32, frame_start, frame_end = value
             split_animation_data['split_anim_crc32'] = split_anim_crc32
             split_animation_data['split_anim_name'] = split_anim_name
             split_animation_data['anim_crc32'] = anim_crc32
@@ -194,14 +231,14 @@ def fileio_open_xpck(context, filepath, file_name = ""):
             split_animation_data['frame_end'] = frame_end
             
             animations_split_data.append(split_animation_data)
-        elif file_name.endswith('.mtninf2'):
-            animations_split_data.extend(minf.open_minf2(archive[file_name])) 
-        elif file_name == 'RES.bin':
-            res_data = res.open_res(data=archive[file_name])
-        elif file_name == 'CMR.bin':
-            camera_hashes = xcmt.open(data=archive[file_name])
-        elif file_name.endswith('.txp'):
-            txp_data.append(txp.read_txp(io.BytesIO(archive[file_name])))
+        elif entry_type == 'SPLIT_ANIMATIONS':
+            animations_split_data.extend(value) 
+        elif entry_type == 'RES':
+            res_data = value
+        elif entry_type == 'CAMERA_HASHES':
+            camera_hashes = value
+        elif entry_type == 'TEXPROJ':
+            txp_data.append(value)
 
     if bpy.context.scene.objects:
         bpy.ops.object.mode_set(mode='OBJECT')
@@ -417,14 +454,14 @@ def fileio_open_xpck(context, filepath, file_name = ""):
             
     return {'FINISHED'}
 
-def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [], armature = None, textures = {}, animations = {}, outlines = [], cameras=[], properties=[], texprojs=[], attach_bone=False):
+def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [], armature = None, textures = {}, animations = {}, outlines = [], cameras=[], properties=[], texprojs=[], attach_bone=False, texture_max_error=4.0, dedup=False, vertex_layout="FLOAT", strip_effort="FULL", optimize_cache=False):
     xmprs = []
     atrs = []
     mtrs = []
     
     if meshes:
         for mesh in meshes:
-            xmprs.append(fileio_write_xmpr(context, mesh.name, mesh.material_name, template[0].modes[template[1]]))
+            xmprs.append(fileio_write_xmpr(operator, context, mesh.name, mesh.material_name, template[0].modes[template[1]], vertex_layout, strip_effort, optimize_cache))
             atrs.append(bytes.fromhex(template[0].atr))
             mtrs.append(bytes.fromhex(template[0].mtr))
 
@@ -437,10 +474,17 @@ def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [],
     # Make images
     imgcs = []
     for texture_name, texture_data in textures.items():
-        get_image_format = globals().get(texture_data['format'])
+        image = bpy.data.images.get(texture_name)
+        image_format = texture_data['format']
+        
+        if image_format == 'AUTO':
+            image_format, analysis = imgc.select_format(image, texture_max_error)
+            operator.report({'INFO'}, f"{texture_name}: {image_format} selected")
+        
+        get_image_format = globals().get(image_format)
         
         if get_image_format:
-            imgcs.append(imgc.write(bpy.data.images.get(texture_name), get_image_format()))
+            imgcs.append(imgc.write(image, get_image_format()))
         else:
             operator.report({'ERROR'}, f"Class {texture.format} not found in img_format.")
             return {'FINISHED'}
@@ -613,6 +657,8 @@ def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [],
             files["RES.bin"] = res.write_xres(b"XRES", items, string_table)
         else: 
             files["RES.bin"] = res.write_res(b"CHRC00\x00\x00", items, string_table)   
+        
+        get_hash_dictionary().update(res.read_string_table(string_table))
     elif mode == "ANIMATION":
         if attach_bone == False:
             armature = None
@@ -627,6 +673,8 @@ def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [],
             files["RES.bin"] = res.write_xres(b"XRES", items, string_table)
         else: 
             files["RES.bin"] = res.write_res(b"CHRC00\x00\x00", items, string_table)   
+        
+        get_hash_dictionary().update(res.read_string_table(string_table))
     elif mode == "MESH":
         pass
         # Not implemented     
@@ -635,7 +683,12 @@ def fileio_write_xpck(operator, context, filepath, template, mode, meshes = [],
             files["CMR.bin"] = xcmt.write(cameras_sorted)
     
     # Create xpck
-    xpck.pack_archive(files, filepath)
+    saved_size = xpck.pack_archive(files, filepath, dedup=dedup)
+    
+    if saved_size > 0:
+        operator.report({'INFO'}, f"Deduplication saved {saved_size} bytes")
+    
+    save_hash_dictionary(operator)
     
     return {'FINISHED'}
 
@@ -802,10 +855,14 @@ class TexturePropertyGroup(bpy.types.PropertyGroup):
     name: bpy.props.StringProperty()
     format: bpy.props.EnumProperty(
         items=[
+            ('AUTO', "Auto", "Pick the smallest format within the error threshold"),
             ('RGBA8', "RGBA8", "Make RGBA8 image"),
             ('RGBA4', "RGBA4", "Make RGBA4 image"),
             ('RBGR888', "RBGR888", "Make RBGR888 image"),
             ('RGB565', "RGB565", "Make RGB565 image"),
+            ('LA8', "LA8", "Make LA8 image"),
+            ('LA4', "LA4", "Make LA4 image"),
+            ('L8', "L8", "Make L8 image"),
             #('L4', "L4", "Make L4 image"),
             #('ETC1', "ETC1", "Make ETC1 image"),
             #('ETC1A4', "ETC1A4", "Make ETC1A4 image"),
@@ -1056,6 +1113,41 @@ class ExportXC(bpy.types.Operator, ExportHelper):
         description="Whether to attach textproj or not",
         default=False
     )
+    
+    texture_max_error: bpy.props.FloatProperty(
+        name="Auto Format Max Error",
+        description="Highest RMS error (0-255 scale) allowed when the texture format is picked automatically",
+        default=4.0,
+        min=0.0,
+        max=255.0,
+        precision=2
+    )
+    
+    dedup: bpy.props.BoolProperty(
+        name="Deduplicate Entries",
+        description="Identical files share the same data in the archive",
+        default=False
+    )
+    
+    vertex_layout: EnumProperty(
+        name="Vertex Layout",
+        description="Choose how the vertex attributes of the meshes are stored",
+        items=VERTEX_LAYOUT_ITEMS,
+        default="FLOAT"
+    )
+    
+    strip_effort: EnumProperty(
+        name="Strip Effort",
+        description="Choose how hard the triangle strips of the meshes are optimized",
+        items=STRIP_EFFORT_ITEMS,
+        default="FULL"
+    )
+    
+    optimize_cache: bpy.props.BoolProperty(
+        name="Optimize Vertex Cache",
+        description="Reorder triangles and vertices of the meshes for the post-transform vertex cache. Helps Greedy strips and triangle lists, the other strip efforts already give a near optimal order",
+        default=False
+    )
 
     def template_items_callback(self, context):
         my_templates = get_templates()
@@ -1211,6 +1303,10 @@ class ExportXC(bpy.types.Operator, ExportHelper):
         # Create a box for export option, mesh group, and armature enum
         options_box = layout.box()
         options_box.prop(self, "export_option", text="Export Option")
+        options_box.prop(self, "dedup")
+        options_box.prop(self, "vertex_layout")
+        options_box.prop(self, "strip_effort")
+        options_box.prop(self, "optimize_cache")
         
         if self.export_option == 'MESH':
             mesh_group = options_box.box()
@@ -1273,6 +1369,7 @@ class ExportXC(bpy.types.Operator, ExportHelper):
                                 meshes_props.append(mesh_prop.name)
 
             groupbox = layout.box()
+            groupbox.prop(self, "texture_max_error")
             box = groupbox.box()
 
             for texture_prop in self.texture_properties:
@@ -1853,6 +1950,11 @@ class ExportXC(bpy.types.Operator, ExportHelper):
             properties=properties, 
             texprojs=texprojs,
             attach_bone=self.attach_bone,
+            texture_max_error=self.texture_max_error,
+            dedup=self.dedup,
+            vertex_layout=self.vertex_layout,
+            strip_effort=self.strip_effort,
+            optimize_cache=self.optimize_cache,
         )
         
 class ImportXC(bpy.types.Operator, ImportHelper):
@@ -1865,5 +1967,37 @@ class ImportXC(bpy.types.Operator, ImportHelper):
         options={'HIDDEN'}
     )
     
+    texture_lod: bpy.props.IntProperty(
+        name="Texture Preview",
+        description="Only decode a 1/2^n preview of the textures (0 decodes the full textures)",
+        default=0,
+        min=0,
+        max=3
+    )
+    
+    use_texture_cache: bpy.props.BoolProperty(
+        name="Texture Cache",
+        description="Keep decoded textures on disk so importing the same archive again skips decoding",
+        default=False
+    )
+    
+    texture_cache_directory: bpy.props.StringProperty(
+        name="Cache Directory",
+        description="Directory of the texture cache (empty uses the default location)",
+        default="",
+        subtype='DIR_PATH'
+    )
+    
+    texture_cache_size: bpy.props.IntProperty(
+        name="Cache Size (MB)",
+        description="Least recently used textures are removed above this size",
+        default=512,
+        min=1
+    )
+    
     def execute(self, context):
-            return fileio_open_xpck(context, self.filepath)
+            texture_cache = None
+            if self.use_texture_cache:
+                texture_cache = TextureCache(self.texture_cache_directory, self.texture_cache_size * 1024 * 1024)
+                
+            return fileio_open_xpck(self, context, self.filepath, texture_lod=self.texture_lod, texture_cache=texture_cache)
@@ -0,0 +1,9 @@
+import os
+import pytest
+
+ADDON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def pytest_collect_directory(path, parent):
+    # The add-on __init__ needs bpy, its folder is collected as a plain directory instead of a package
+    if str(path) == ADDON_DIRECTORY:
+        return pytest.Dir.from_parent(parent, path=path)
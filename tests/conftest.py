@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Register the add-on folder as the studio_eleven package, without bpy, like cli.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
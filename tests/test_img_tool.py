@@ -0,0 +1,13 @@
+import numpy as np
+
+from studio_eleven.utils import img_format, img_tool
+
+def test_rgba4_quantization_matches_decoder():
+    # Every 8-bit value on every channel
+    colors = np.stack([np.arange(256)] * 4, axis=1).astype(np.uint8)
+    colors[:, 3] = colors[::-1, 3]
+
+    image_format = img_format.RGBA4()
+    decoded = [image_format.decode(image_format.encode(img_format.Color(color.tolist())), 0) for color in colors]
+
+    assert img_tool.quantize_colors(colors, "RGBA4").tolist() == [[color.r, color.g, color.b, color.a] for color in decoded]
@@ -0,0 +1,94 @@
+import io
+
+import numpy as np
+
+from studio_eleven.formats import xmpr
+from studio_eleven.utils import array_stripifier
+
+def make_grids(count, size):
+    # count separate size x size grids, each one a component of its own
+    indices = []
+    vertices = []
+
+    for grid in range(count):
+        base = len(vertices)
+        vertices += [(float(x), float(y), float(grid)) for y in range(size + 1) for x in range(size + 1)]
+
+        for y in range(size):
+            for x in range(size):
+                a = base + y * (size + 1) + x
+                indices += [(a, a + 1, a + size + 1), (a + 1, a + size + 2, a + size + 1)]
+
+    # Number the vertices in first-use order, as the exporter's welding does
+    order = list(dict.fromkeys(i for triangle in indices for i in triangle))
+    remap = {old: new for new, old in enumerate(order)}
+    return [tuple(remap[i] for i in triangle) for triangle in indices], [vertices[i] for i in order]
+
+def write_mesh(indices, vertices, **options):
+    uvs = [(x / 8, y / 8) for x, y, z in vertices]
+    normals = [(0.0, 0.0, 1.0)] * len(vertices)
+    colors = [(0.0, 0.0, 0.0, 1.0)] * len(vertices)
+    weights = {i: {0: 1.0} for i in range(len(vertices))}
+
+    return xmpr.write("mesh", [[0, 0, 0], [1, 1, 1]], indices, vertices, uvs, normals, colors, weights, ["root"], "material", ["00000000"], **options)
+
+def get_triangle_positions(data):
+    mesh = xmpr.open_xmpr(io.BytesIO(data))
+    positions = np.asarray(mesh["vertices"]["positions"])[np.asarray(mesh["triangles"])]
+    return sorted(tuple(sorted(map(tuple, triangle.tolist()))) for triangle in positions)
+
+def test_export_stripifies_components_in_worker_processes(monkeypatch):
+    indices, vertices = make_grids(4, 8)
+    monkeypatch.setattr(array_stripifier, "PARALLEL_MIN_FACES", 0)
+
+    pools = []
+    make_process_pool = array_stripifier.make_process_pool
+    monkeypatch.setattr(array_stripifier, "make_process_pool", lambda jobs: pools.append(jobs) or make_process_pool(jobs))
+
+    pooled = write_mesh(indices, vertices, strip_effort="LOW", jobs=2)
+    assert pools == [2]
+
+    # The chunks don't depend on the number of jobs
+    assert write_mesh(indices, vertices, strip_effort="LOW", jobs=1) == pooled
+
+    expected = sorted(tuple(sorted(vertices[i] for i in triangle)) for triangle in indices)
+    assert get_triangle_positions(pooled) == expected
+
+def test_optimize_mesh_returns_acmr():
+    indices, vertices = make_grids(1, 8)
+    uvs = [(0.0, 0.0)] * len(vertices)
+    normals = [(0.0, 0.0, 1.0)] * len(vertices)
+
+    (optimized, optimized_vertices, *_), (acmr_before, acmr_after) = xmpr.optimize_mesh(indices, vertices, uvs, normals, [], {})
+    assert acmr_after <= acmr_before
+
+    expected = sorted(tuple(sorted(vertices[i] for i in triangle)) for triangle in indices)
+    assert sorted(tuple(sorted(optimized_vertices[i] for i in triangle)) for triangle in optimized) == expected
+
+def test_weights_without_bone_indices_bind_nothing():
+    attribute_table, stride = xmpr.make_attribute_table([
+        (xmpr.ATTRIBUTE_POSITION, 3, np.dtype("<f4")),
+        (xmpr.ATTRIBUTE_WEIGHTS, 4, np.dtype("<f4")),
+    ])
+    vertices = np.zeros((3, 7), dtype="<f4")
+    vertices[:, 3] = 1.0
+
+    buffer = xmpr.parse_buffer(io.BytesIO(xmpr.write_xpvb(vertices.tobytes(), attribute_table, stride)), [0x1234])
+    assert len(buffer["weights"]) == 3
+    assert list(xmpr.get_weight_batches(buffer["weights"], buffer["bone_indices"])) == []
+
+def test_unsupported_attributes_are_collected_as_warnings(capsys):
+    attribute_table, stride = xmpr.make_attribute_table([
+        (xmpr.ATTRIBUTE_POSITION, 3, np.dtype("<f4")),
+        (xmpr.ATTRIBUTE_COLOR, 4, np.dtype("<u1")),
+    ])
+    # No numpy type for this component type
+    count, offset, size, component_type = attribute_table[xmpr.ATTRIBUTE_COLOR]
+    attribute_table[xmpr.ATTRIBUTE_COLOR] = (count, offset, size, 0x05)
+
+    warnings = []
+    buffer = xmpr.parse_buffer(io.BytesIO(xmpr.write_xpvb(bytes(stride * 3), attribute_table, stride)), [], warnings=warnings)
+
+    assert buffer["color_data"].tolist() == [[0.0] * 4] * 3
+    assert warnings == ["Unsupported XPVB attribute 9: type 0x5 with 4 components in 4 bytes"]
+    assert capsys.readouterr().out == ""
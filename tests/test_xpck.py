@@ -0,0 +1,36 @@
+from studio_eleven.formats import xpck
+
+def get_offsets(path):
+    with xpck.Archive(path) as archive:
+        return {name: entry.offset for name, entry in archive.entries.items()}
+
+def test_compact_keeps_shared_payloads(tmp_path):
+    path = str(tmp_path / "shared.xc")
+    atr = bytes(range(208))
+    xpck.pack_archive({"a.atr": atr, "b.atr": atr, "c.bin": b"c" * 40}, path, dedup=True)
+
+    offsets = get_offsets(path)
+    assert offsets["a.atr"] == offsets["b.atr"]
+
+    # c.bin no longer fits in its slot, it is appended and then compacted
+    result = xpck.update_archive(path, {"c.bin": b"d" * 4000}, compact=True)
+    assert result["appended"] == ["c.bin"]
+
+    offsets = get_offsets(path)
+    assert offsets["a.atr"] == offsets["b.atr"]
+
+    files = xpck.open_file(path)
+    assert files["a.atr"][:208] == atr and files["b.atr"][:208] == atr
+    assert files["c.bin"][:4000] == b"d" * 4000
+
+def test_new_names_keep_shared_payloads(tmp_path):
+    path = str(tmp_path / "shared.xc")
+    atr = bytes(range(208))
+    xpck.pack_archive({"a.atr": atr, "b.atr": atr}, path, dedup=True)
+
+    result = xpck.update_archive(path, {"new.bin": b"new"})
+    assert result["repacked"] == ["new.bin"]
+
+    offsets = get_offsets(path)
+    assert offsets["a.atr"] == offsets["b.atr"]
+    assert offsets["new.bin"] != offsets["a.atr"]
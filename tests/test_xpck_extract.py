@@ -0,0 +1,34 @@
+import numpy as np
+
+from studio_eleven.formats import xpck, xpck_extract, imgc
+from studio_eleven.utils import img_format
+
+def make_texture(seed):
+    rng = np.random.default_rng(seed)
+    return imgc.write_pixels(rng.integers(0, 256, (16 * 16, 4)).tolist(), 16, 16, img_format.RGBA8())
+
+def test_process_pool_matches_in_place(tmp_path, monkeypatch):
+    path = str(tmp_path / "parent.xc")
+    child_path = str(tmp_path / "child.xv")
+    xpck.pack_archive({"t0.xi": make_texture(0), "bad.prm": b"junk" * 8, "x.bin": b"1"}, child_path)
+    xpck.pack_archive({"child.xv": child_path, "t1.xi": make_texture(1), "t2.xi": make_texture(2)}, path)
+
+    in_place, in_place_errors = xpck_extract.extract_archive(path, jobs=1)
+
+    # Small enough to be parsed in place otherwise
+    monkeypatch.setattr(xpck_extract, "PARALLEL_MIN_SIZE", 0)
+    pools = []
+    make_process_pool = xpck_extract.make_process_pool
+    monkeypatch.setattr(xpck_extract, "make_process_pool", lambda jobs: pools.append(jobs) or make_process_pool(jobs))
+    pooled, pooled_errors = xpck_extract.extract_archive(path, jobs=2)
+
+    assert pools == [2]
+
+    assert list(pooled) == list(in_place)
+    assert pooled_errors == in_place_errors == [("parent.xc/child.xv/bad.prm", in_place["parent.xc/child.xv/bad.prm"]["error"])]
+
+    for entry_path, entry in in_place.items():
+        if entry["type"] == 'TEXTURE':
+            pixels, width, height, has_alpha = entry["value"]
+            assert np.array_equal(pooled[entry_path]["value"][0], pixels)
+            assert pooled[entry_path]["value"][1:] == (width, height, has_alpha)
@@ -0,0 +1,123 @@
+import os
+import time
+import hashlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+from ..formats import xpck
+from .files import iter_files, map_unordered
+from .catalog import ARCHIVE_EXTENSIONS
+
+##########################################
+# Verify
+##########################################
+
+def verify_file(path, deep=False):
+    start = time.perf_counter()
+
+    try:
+        errors = xpck.verify_archive(path, deep, os.path.basename(path))
+    except Exception as e:
+        errors = [(os.path.basename(path), str(e))]
+
+    return path, time.perf_counter() - start, errors
+
+def verify_paths(paths, deep=False, jobs=None):
+    jobs = jobs or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        arguments = ((path, deep) for root in paths for path in iter_files(root, ARCHIVE_EXTENSIONS))
+        yield from map_unordered(executor, verify_file, arguments, jobs * 4)
+
+def run_verify(args):
+    start = time.perf_counter()
+    checked = 0
+    failed = 0
+
+    for path, elapsed, errors in verify_paths(args.paths, args.deep, args.jobs):
+        checked += 1
+
+        if errors:
+            failed += 1
+            for entry_path, message in errors:
+                print(f"{path}: {entry_path}: {message}")
+        elif args.verbose:
+            print(f"{elapsed:8.3f}s  OK {path}")
+
+    print(f"{checked} checked, {failed} with errors in {time.perf_counter() - start:.3f}s")
+    return 1 if failed else 0
+
+##########################################
+# Diff
+##########################################
+
+def hash_entry(archive, name):
+    return hashlib.blake2b(archive.view(name), digest_size=16).digest()
+
+def diff_archives(path_a, path_b):
+    # Entries are compared by size and hash of the raw bytes, only the different ones are decompressed
+    added = []
+    removed = []
+    changed = []
+
+    with xpck.Archive(path_a) as archive_a, xpck.Archive(path_b) as archive_b:
+        for name in archive_a.names():
+            if name not in archive_b:
+                removed.append((name, archive_a.info(name)["decompressed_size"]))
+
+        for name in archive_b.names():
+            if name not in archive_a:
+                added.append((name, archive_b.info(name)["decompressed_size"]))
+                continue
+
+            size_a = archive_a.entries[name].size
+            size_b = archive_b.entries[name].size
+
+            if size_a == size_b and hash_entry(archive_a, name) == hash_entry(archive_b, name):
+                continue
+
+            data_a = archive_a.read(name)
+            data_b = archive_b.read(name)
+
+            # Same content stored with another compression or padding, read() trims to the decoded size
+            changed.append((name, len(data_a), len(data_b), data_a != data_b))
+
+    return added, removed, changed
+
+def run_diff(args):
+    added, removed, changed = diff_archives(args.archive_a, args.archive_b)
+    size_delta = 0
+
+    for name, size in added:
+        size_delta += size
+        print(f"+ {name} ({size} bytes)")
+
+    for name, size in removed:
+        size_delta -= size
+        print(f"- {name} ({size} bytes)")
+
+    for name, size_a, size_b, content_changed in changed:
+        size_delta += size_b - size_a
+        print(f"~ {name} ({size_a} -> {size_b} bytes{'' if content_changed else ', same decoded content'})")
+
+    print(f"{len(added)} added, {len(removed)} removed, {len(changed)} changed, decoded size {size_delta:+d} bytes")
+    return 1 if added or removed or changed else 0
+
+##########################################
+# Command Line
+##########################################
+
+def add_arguments(parser):
+    subparsers = parser.add_subparsers(dest="archive_command", required=True)
+
+    verify_parser = subparsers.add_parser("verify", help="Check the tables and entry headers of archives")
+    verify_parser.add_argument("paths", nargs="+", help="Archives or directories to walk")
+    verify_parser.add_argument("--deep", action="store_true", help="Also decompress entries and check nested archives")
+    verify_parser.add_argument("-j", "--jobs", type=int, help="Worker processes, defaults to the CPU count")
+    verify_parser.add_argument("-v", "--verbose", action="store_true", help="Also print the archives without errors")
+    verify_parser.set_defaults(run=run_verify)
+
+    diff_parser = subparsers.add_parser("diff", help="List the entries added, removed or changed between two archives")
+    diff_parser.add_argument("archive_a")
+    diff_parser.add_argument("archive_b")
+    diff_parser.set_defaults(run=run_diff)
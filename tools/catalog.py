@@ -0,0 +1,191 @@
+import os
+import time
+import sqlite3
+
+from concurrent.futures import ProcessPoolExecutor
+
+from ..formats import xpck, xpck_extract, res
+from ..utils.hash_dictionary import get_hash_dictionary
+from .files import iter_files, map_unordered
+
+ARCHIVE_EXTENSIONS = (".xc", ".xv", ".xa", ".xr", ".pck")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    archive TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    crc INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    compression TEXT,
+    decompressed_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS res_names (
+    archive TEXT NOT NULL,
+    path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    crc INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_archive ON entries (archive);
+CREATE INDEX IF NOT EXISTS entries_name ON entries (name);
+CREATE INDEX IF NOT EXISTS res_names_archive ON res_names (archive);
+CREATE INDEX IF NOT EXISTS res_names_name ON res_names (name);
+"""
+
+##########################################
+# Indexing
+##########################################
+
+def get_res_names(data):
+    names = []
+
+    for res_type, items in res.open_res(data=data).items():
+        for crc, item in items.items():
+            name = item["name"] if isinstance(item, dict) else item
+            names.append((res_type.name, crc, name))
+
+    return names
+
+def walk_entries(archive, archive_path, entries, res_names):
+    for name in archive.names():
+        info = archive.info(name)
+        entry_path = archive_path + "/" + name
+
+        entries.append((entry_path, name, info["crc"], info["offset"], info["size"], info["compression"], info["decompressed_size"]))
+
+        if name.endswith(xpck_extract.ARCHIVE_EXTENSIONS):
+            try:
+                walk_entries(xpck.Archive(archive.view(name)), entry_path, entries, res_names)
+            except Exception as e:
+                print("Couldn't read", entry_path, e)
+        elif name == "RES.bin":
+            try:
+                res_names.extend((entry_path,) + res_name for res_name in get_res_names(archive.raw(name)))
+            except Exception as e:
+                print("Couldn't read", entry_path, e)
+
+def index_archive(path, mtime, size):
+    # Runs in a worker process, only plain rows go back to the writer
+    entries = []
+    res_names = []
+    error = None
+
+    try:
+        with xpck.Archive(path) as archive:
+            walk_entries(archive, os.path.basename(path), entries, res_names)
+    except Exception as e:
+        error = str(e)
+
+    return path, mtime, size, entries, res_names, error
+
+def open_catalog(catalog_path):
+    connection = sqlite3.connect(catalog_path)
+    connection.executescript(SCHEMA)
+    return connection
+
+def update_catalog(connection, path, mtime, size, entries, res_names, error):
+    connection.execute("DELETE FROM entries WHERE archive = ?", (path,))
+    connection.execute("DELETE FROM res_names WHERE archive = ?", (path,))
+    connection.execute("INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?)", (path, mtime, size, error))
+    connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(path,) + entry for entry in entries])
+    connection.executemany("INSERT INTO res_names VALUES (?, ?, ?, ?, ?)", [(path,) + res_name for res_name in res_names])
+
+def iter_changed_archives(root, known, seen):
+    # Archives whose mtime and size didn't change since the last run are skipped
+    for path in iter_files(root, ARCHIVE_EXTENSIONS):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        seen.add(path)
+
+        if known.get(path) != (stat.st_mtime, stat.st_size):
+            yield path, stat.st_mtime, stat.st_size
+
+def index_directory(root, catalog_path, jobs=None):
+    jobs = jobs or os.cpu_count() or 1
+    connection = open_catalog(catalog_path)
+
+    known = {path: (mtime, size) for path, mtime, size in connection.execute("SELECT path, mtime, size FROM archives")}
+    seen = set()
+    hash_dictionary = get_hash_dictionary()
+
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for i, result in enumerate(map_unordered(executor, index_archive, iter_changed_archives(root, known, seen), jobs * 4)):
+                update_catalog(connection, *result)
+                yield result
+
+                # Every name seen feeds the shared hash dictionary
+                path, mtime, size, entries, res_names, error = result
+                for entry_path, name, *info in entries:
+                    hash_dictionary.add(name)
+                for entry_path, res_type, crc, name in res_names:
+                    hash_dictionary.add(name, crc)
+
+                if i % 256 == 255:
+                    connection.commit()
+
+        # Forget the archives removed from this tree
+        root_path = os.path.join(os.path.abspath(root), "")
+        for path in known:
+            if path.startswith(root_path) and path not in seen:
+                update_catalog(connection, path, 0, 0, [], [], None)
+                connection.execute("DELETE FROM archives WHERE path = ?", (path,))
+
+        connection.commit()
+        hash_dictionary.save()
+    finally:
+        connection.close()
+
+def find_entries(catalog_path, pattern):
+    connection = open_catalog(catalog_path)
+
+    try:
+        return connection.execute(
+            "SELECT archive, path FROM entries WHERE name LIKE ? "
+            "UNION SELECT archive, path || ':' || type || ':' || name FROM res_names WHERE name LIKE ? "
+            "ORDER BY archive",
+            (pattern, pattern)
+        ).fetchall()
+    finally:
+        connection.close()
+
+##########################################
+# Command Line
+##########################################
+
+def add_arguments(parser):
+    parser.add_argument("catalog", help="SQLite catalog, created when missing")
+    parser.add_argument("root", nargs="?", help="Directory of archives to (re)index")
+    parser.add_argument("--find", help="Print the archives that contain an entry or a RES name matching this LIKE pattern")
+    parser.add_argument("-j", "--jobs", type=int, help="Worker processes, defaults to the CPU count")
+    parser.set_defaults(run=run)
+
+def run(args):
+    if args.root:
+        start = time.perf_counter()
+        indexed = 0
+        failed = 0
+
+        for path, mtime, size, entries, res_names, error in index_directory(args.root, args.catalog, args.jobs):
+            if error:
+                failed += 1
+                print(f"FAILED {path}: {error}")
+            else:
+                indexed += 1
+                print(f"{path}: {len(entries)} entries")
+
+        print(f"{indexed} indexed, {failed} failed in {time.perf_counter() - start:.3f}s")
+
+    if args.find:
+        for archive, path in find_entries(args.catalog, args.find):
+            print(f"{archive}  {path}")
+
+    return 0
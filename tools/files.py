@@ -0,0 +1,30 @@
+import os
+
+from concurrent.futures import wait, FIRST_COMPLETED
+
+def iter_files(path, extensions):
+    # Streamed, the pool starts working before the whole tree is walked
+    if os.path.isfile(path):
+        yield path
+        return
+
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path, extensions)
+            elif entry.is_file() and entry.name.lower().endswith(extensions):
+                yield entry.path
+
+def map_unordered(executor, function, arguments, max_pending):
+    # Like executor.map, but results come as they finish and only max_pending jobs are queued
+    pending = set()
+
+    for args in arguments:
+        pending.add(executor.submit(function, *args))
+
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from (future.result() for future in done)
+
+    for future in pending:
+        yield future.result()
@@ -0,0 +1,275 @@
+import os
+import re
+import time
+import zlib
+import struct
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from ..formats import imgc
+from ..utils import img_tool, img_format
+from .files import iter_files, map_unordered
+
+IMGC_EXTENSIONS = (".xi",)
+PNG_EXTENSIONS = (".png",)
+RAW_EXTENSIONS = (".rgba",)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Raw files have no header, their size is kept in the name: name_WxH.rgba
+RAW_SIZE_PATTERN = re.compile(r"_(\d+)x(\d+)$")
+
+##########################################
+# PNG
+##########################################
+
+def paeth_predictor(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+
+    if pa <= pb and pa <= pc:
+        return a
+    elif pb <= pc:
+        return b
+    else:
+        return c
+
+def unfilter_png(data, width, height, bpp):
+    stride = width * bpp
+    rows = np.frombuffer(data, dtype=np.uint8)[:(stride + 1) * height].reshape(height, stride + 1)
+    out = np.zeros((height, stride), dtype=np.uint8)
+    previous = np.zeros(stride, dtype=np.uint8)
+
+    for y in range(height):
+        filter_type = rows[y, 0]
+        line = rows[y, 1:]
+
+        if filter_type == 0:
+            current = line.copy()
+        elif filter_type == 1:
+            # Sub is a running sum per channel
+            current = np.cumsum(line.reshape(-1, bpp), axis=0, dtype=np.uint32).astype(np.uint8).ravel()
+        elif filter_type == 2:
+            current = line + previous
+        elif filter_type in (3, 4):
+            current = bytearray(line.tobytes())
+            above = previous.tolist()
+
+            for i in range(stride):
+                left = current[i - bpp] if i >= bpp else 0
+                upper_left = above[i - bpp] if i >= bpp else 0
+
+                if filter_type == 3:
+                    current[i] = (current[i] + ((left + above[i]) >> 1)) & 0xFF
+                else:
+                    current[i] = (current[i] + paeth_predictor(left, above[i], upper_left)) & 0xFF
+
+            current = np.frombuffer(bytes(current), dtype=np.uint8)
+        else:
+            raise ValueError(f"Unknown PNG filter type: {filter_type}")
+
+        out[y] = current
+        previous = out[y]
+
+    return out
+
+def read_png(data):
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+
+    pos = 8
+    idat = []
+    palette = None
+    transparency = None
+
+    while pos < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+        if chunk_type == b"IHDR":
+            width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", chunk)
+        elif chunk_type == b"PLTE":
+            palette = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, 3)
+        elif chunk_type == b"tRNS":
+            transparency = chunk
+        elif chunk_type == b"IDAT":
+            idat.append(chunk)
+        elif chunk_type == b"IEND":
+            break
+
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color_type)
+
+    if channels is None or bit_depth not in (8, 16) or (color_type == 3 and bit_depth != 8):
+        raise ValueError(f"Unsupported PNG color type {color_type} with bit depth {bit_depth}")
+
+    if interlace:
+        raise ValueError("Interlaced PNG are not supported")
+
+    bpp = channels * bit_depth // 8
+    rows = unfilter_png(zlib.decompress(b"".join(idat)), width, height, bpp)
+
+    # Keep the most significant byte of 16 bits samples
+    samples = rows.reshape(height, width, channels, bit_depth // 8)[..., 0]
+
+    if color_type == 3:
+        alpha = np.full(len(palette), 255, dtype=np.uint8)
+        if transparency:
+            alpha[:len(transparency)] = np.frombuffer(transparency, dtype=np.uint8)[:len(palette)]
+        px = np.concatenate([palette, alpha[:, None]], axis=1)[samples[..., 0]]
+    else:
+        if color_type in (0, 4):
+            samples = samples[..., [0, 0, 0] + ([1] if color_type == 4 else [])]
+
+        if samples.shape[2] == 3:
+            samples = np.concatenate([samples, np.full((height, width, 1), 255, dtype=np.uint8)], axis=2)
+
+        px = samples
+
+    # Top row first
+    return np.ascontiguousarray(px, dtype=np.uint8)
+
+def write_png_chunk(chunk_type, chunk):
+    return struct.pack(">I", len(chunk)) + chunk_type + chunk + struct.pack(">I", zlib.crc32(chunk_type + chunk))
+
+def write_png(px):
+    height, width = px.shape[:2]
+
+    # Filter type 0 on every row
+    rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 1:] = px.reshape(height, width * 4)
+
+    out = PNG_SIGNATURE
+    out += write_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+    out += write_png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 6))
+    out += write_png_chunk(b"IEND", b"")
+
+    return out
+
+##########################################
+# Conversion
+##########################################
+
+def decode_imgc(data):
+    image = imgc.open(data)
+
+    if image is None:
+        raise ValueError("Unsupported IMGC image format")
+
+    pixels, width, height, has_alpha = image
+
+    # imgc.open gives Blender pixels: floats, bottom row first
+    px = np.asarray(pixels, dtype=np.float32).reshape(height, width, 4)[::-1]
+    return np.round(px * 255).astype(np.uint8)
+
+def encode_imgc(px, format_name, max_error):
+    if format_name == "AUTO":
+        format_name, analysis = img_tool.select_image_format(px.reshape(-1, 4), max_error)
+
+    height, width = px.shape[:2]
+
+    return imgc.write_pixels(px.reshape(-1, 4).tolist(), width, height, getattr(img_format, format_name)()), format_name
+
+def get_raw_size(path, size):
+    match = RAW_SIZE_PATTERN.search(os.path.splitext(os.path.basename(path))[0])
+
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    elif size:
+        return size
+    else:
+        raise ValueError("Raw file without size, name it name_WxH.rgba or pass --size")
+
+def get_destination(source, input_root, output_root, target):
+    relative_path = os.path.relpath(source, input_root) if os.path.isdir(input_root) else os.path.basename(source)
+    stem = os.path.splitext(relative_path)[0]
+
+    if target == "imgc":
+        stem = RAW_SIZE_PATTERN.sub("", stem)
+        return os.path.join(output_root, stem + IMGC_EXTENSIONS[0])
+    elif target == "png":
+        return os.path.join(output_root, stem + PNG_EXTENSIONS[0])
+    else:
+        # The size is only known once decoded, convert_file adds it
+        return os.path.join(output_root, stem)
+
+def convert_file(source, destination, target, format_name="AUTO", max_error=4.0, size=None):
+    start = time.perf_counter()
+    note = ""
+
+    try:
+        with open(source, "rb") as file:
+            data = file.read()
+
+        if target == "imgc":
+            if source.lower().endswith(PNG_EXTENSIONS):
+                px = read_png(data)
+            else:
+                width, height = get_raw_size(source, size)
+                px = np.frombuffer(data, dtype=np.uint8)[:width * height * 4].reshape(height, width, 4)
+
+            out, note = encode_imgc(px, format_name, max_error)
+        else:
+            px = decode_imgc(data)
+
+            if target == "png":
+                out = write_png(px)
+            else:
+                destination += "_{}x{}{}".format(px.shape[1], px.shape[0], RAW_EXTENSIONS[0])
+                out = px.tobytes()
+
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        with open(destination, "wb") as file:
+            file.write(out)
+
+        return source, destination, time.perf_counter() - start, note, None
+    except Exception as e:
+        return source, destination, time.perf_counter() - start, note, str(e)
+
+def convert_directory(input_path, output_path, target, format_name="AUTO", max_error=4.0, size=None, jobs=None):
+    extensions = PNG_EXTENSIONS + RAW_EXTENSIONS if target == "imgc" else IMGC_EXTENSIONS
+    jobs = jobs or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        arguments = ((source, get_destination(source, input_path, output_path, target), target, format_name, max_error, size)
+            for source in iter_files(input_path, extensions))
+
+        yield from map_unordered(executor, convert_file, arguments, jobs * 4)
+
+##########################################
+# Command Line
+##########################################
+
+def parse_size(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+def add_arguments(parser):
+    parser.add_argument("input", help="IMGC, PNG or raw file, or a directory to walk")
+    parser.add_argument("output", help="Output directory")
+    parser.add_argument("--to", dest="target", choices=["png", "raw", "imgc"], default="png", help="Output type")
+    parser.add_argument("--format", dest="format_name", default="AUTO",
+        choices=["AUTO", "RGBA8", "RGBA4", "RBGR888", "RGB565", "LA8", "LA4", "L8"], help="IMGC format when encoding")
+    parser.add_argument("--max-error", type=float, default=4.0, help="Highest RMS error allowed by the AUTO format")
+    parser.add_argument("--size", type=parse_size, help="WxH of raw inputs without the size in their name")
+    parser.add_argument("-j", "--jobs", type=int, help="Worker processes, defaults to the CPU count")
+    parser.set_defaults(run=run)
+
+def run(args):
+    start = time.perf_counter()
+    converted = 0
+    failed = 0
+
+    for source, destination, elapsed, note, error in convert_directory(args.input, args.output, args.target, args.format_name, args.max_error, args.size, args.jobs):
+        if error:
+            failed += 1
+            print(f"{elapsed:8.3f}s  FAILED {source}: {error}")
+        else:
+            converted += 1
+            print(f"{elapsed:8.3f}s  {source} -> {destination}" + (f" ({note})" if note else ""))
+
+    print(f"{converted} converted, {failed} failed in {time.perf_counter() - start:.3f}s")
+    return 1 if failed else 0
@@ -1,11 +1,20 @@
 from .trianglemesh import *
 from .trianglestripifier import *
 from .tristrip import *
+from .array_stripifier import *
+from .vertex_cache import *
 
 from .img_tool import *
 from .img_format import *
 from .img_swizzle import *
+from .img_cache import *
+
+from .hash_dictionary import *
 
 from .properties import *
 
-from .mesh_faces_utils import *
\ No newline at end of file
+# Needs bpy, missing when the tools run outside of Blender
+try:
+    from .mesh_faces_utils import *
+except ImportError:
+    pass
\ No newline at end of file
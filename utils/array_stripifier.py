@@ -0,0 +1,320 @@
+import numpy as np
+
+from collections import deque
+from itertools import repeat
+
+from .tristrip import stitch_strips
+from .process_pool import get_jobs, make_process_pool
+
+# Experiments sampled per pass, GREEDY grows one strip at a time in face order
+# and FULL matches the sampling of TriangleStripifier
+STRIP_EFFORTS = {
+    "GREEDY": 0,
+    "LOW": 1,
+    "MEDIUM": 3,
+    "FULL": 10,
+}
+
+# Smaller meshes are not worth sending to worker processes
+PARALLEL_MIN_FACES = 8192
+
+# Larger meshes are split in this many chunks of whole components whatever the number
+# of jobs, so the strips are the same on every machine
+PARALLEL_CHUNKS = 8
+
+##########################################
+# Faces
+##########################################
+
+def prepare_faces(triangles):
+    # Same faces as trianglemesh.Mesh: no degenerate or duplicate face, lowest vertex first,
+    # but kept in input order so strips follow an order optimized for the vertex cache
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    t0, t1, t2 = triangles.T
+    triangles = triangles[(t0 != t1) & (t1 != t2) & (t2 != t0)]
+
+    rotation = (triangles.argmin(axis=1)[:, None] + np.arange(3)) % 3
+    triangles = np.take_along_axis(triangles, rotation, axis=1)
+
+    first_faces = np.unique(triangles, axis=0, return_index=True)[1]
+    return triangles[np.sort(first_faces)]
+
+def build_adjacency(faces):
+    # CSR layout: the faces across the edge opposite corner k of face f are
+    # adjacent_faces[adjacent_start[f * 3 + k]:adjacent_start[f * 3 + k + 1]]
+    vertex_count = int(faces.max()) + 1 if len(faces) else 0
+
+    edge_start = faces[:, [1, 2, 0]].ravel()
+    edge_end = faces[:, [2, 0, 1]].ravel()
+    keys = edge_start * vertex_count + edge_end
+    reverse_keys = edge_end * vertex_count + edge_start
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    low = np.searchsorted(sorted_keys, reverse_keys, 'left')
+    counts = np.searchsorted(sorted_keys, reverse_keys, 'right') - low
+
+    adjacent_start = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=adjacent_start[1:])
+
+    positions = np.arange(adjacent_start[-1]) - np.repeat(adjacent_start[:-1] - low, counts)
+    adjacent_faces = order[positions] // 3
+
+    return adjacent_start.tolist(), adjacent_faces.tolist()
+
+def split_components(faces, adjacent_start, adjacent_faces, count):
+    # Connected faces stay together, components are spread over count chunks by size
+    component = [-1] * len(faces)
+    components = []
+
+    for seed in range(len(faces)):
+        if component[seed] >= 0:
+            continue
+
+        component[seed] = len(components)
+        members = [seed]
+        i = 0
+
+        while i < len(members):
+            face = members[i]
+            i += 1
+
+            for other_face in adjacent_faces[adjacent_start[face * 3]:adjacent_start[face * 3 + 3]]:
+                if component[other_face] < 0:
+                    component[other_face] = len(components)
+                    members.append(other_face)
+
+        components.append(members)
+
+    chunks = [[] for i in range(count)]
+    for members in sorted(components, key=len, reverse=True):
+        min(chunks, key=len).extend(members)
+
+    return [faces[np.sort(chunk)] for chunk in chunks if chunk]
+
+##########################################
+# Strips
+##########################################
+
+class ArrayStrip:
+    __slots__ = ("faces", "vertices", "reversed_")
+
+    def __init__(self):
+        self.faces = deque()
+        self.vertices = deque()
+        self.reversed_ = False
+
+    def get_strip(self):
+        # Strip in forward winding, like TriangleStrip.get_strip
+        vertices = list(self.vertices)
+
+        if not self.reversed_:
+            return vertices
+        elif len(vertices) & 1:
+            return vertices[::-1]
+        elif len(vertices) == 4:
+            return [vertices[0], vertices[2], vertices[1], vertices[3]]
+        else:
+            return [vertices[0]] + vertices
+
+class ArrayStripifier:
+    # Port of TriangleStripifier over integer arrays, faces are indices and
+    # the faces taken by an experiment are kept in a set until it is chosen
+
+    def __init__(self, faces):
+        self.faces = [tuple(face) for face in np.asarray(faces).tolist()]
+        self.adjacent_start, self.adjacent_faces = build_adjacency(np.asarray(faces, dtype=np.int64).reshape(-1, 3))
+        self.stripped = bytearray(len(self.faces))
+
+    def get_next_vertex(self, face, vertex):
+        verts = self.faces[face]
+        return verts[(1, 2, 0)[verts.index(vertex)]]
+
+    def get_unstripped_adjacent_face(self, face, vertex, taken):
+        half_edge = face * 3 + self.faces[face].index(vertex)
+
+        for other_face in self.adjacent_faces[self.adjacent_start[half_edge]:self.adjacent_start[half_edge + 1]]:
+            if not self.stripped[other_face] and other_face not in taken:
+                return other_face
+
+        return -1
+
+    def traverse_faces(self, strip, start_vertex, start_face, forward, taken):
+        count = 0
+        pv0 = start_vertex
+        pv1 = self.get_next_vertex(start_face, pv0)
+        pv2 = self.get_next_vertex(start_face, pv1)
+        next_face = self.get_unstripped_adjacent_face(start_face, pv0, taken)
+
+        while next_face >= 0:
+            taken.add(next_face)
+            count += 1
+
+            if count & 1:
+                if forward:
+                    pv0 = pv1
+                    pv1 = self.get_next_vertex(next_face, pv0)
+                    strip.vertices.append(pv1)
+                    strip.faces.append(next_face)
+                else:
+                    pv0 = pv2
+                    pv2 = self.get_next_vertex(next_face, pv1)
+                    strip.vertices.appendleft(pv2)
+                    strip.faces.appendleft(next_face)
+                    strip.reversed_ = not strip.reversed_
+            else:
+                if forward:
+                    pv0 = pv2
+                    pv2 = self.get_next_vertex(next_face, pv1)
+                    strip.vertices.append(pv2)
+                    strip.faces.append(next_face)
+                else:
+                    pv0 = pv1
+                    pv1 = self.get_next_vertex(next_face, pv0)
+                    strip.vertices.appendleft(pv1)
+                    strip.faces.appendleft(next_face)
+                    strip.reversed_ = not strip.reversed_
+
+            next_face = self.get_unstripped_adjacent_face(next_face, pv0, taken)
+
+        return count
+
+    def build_strip(self, start_vertex, start_face, taken):
+        # Forwards then backwards, returns the strip and the index of start_face in it
+        strip = ArrayStrip()
+        v0 = start_vertex
+        v1 = self.get_next_vertex(start_face, v0)
+        v2 = self.get_next_vertex(start_face, v1)
+
+        taken.add(start_face)
+        strip.faces.append(start_face)
+        strip.vertices.extend((v0, v1, v2))
+
+        self.traverse_faces(strip, v0, start_face, True, taken)
+        start_index = self.traverse_faces(strip, v2, start_face, False, taken)
+
+        strip.faces = list(strip.faces)
+        strip.vertices = list(strip.vertices)
+        return strip, start_index
+
+    def build_adjacent(self, strips, strip, face_index, taken):
+        # Parallel strips, walked in a loop where TriangleStripifier recurses
+        found = False
+
+        while True:
+            other_face = self.get_unstripped_adjacent_face(strip.faces[face_index], strip.vertices[face_index + 1], taken)
+            if other_face < 0:
+                return found
+
+            winding = strip.reversed_ != bool(face_index & 1)
+            other_vertex = strip.vertices[face_index] if winding else strip.vertices[face_index + 2]
+            other_strip, other_index = self.build_strip(other_vertex, other_face, taken)
+            strips.append(other_strip)
+            found = True
+
+            if other_index > (len(other_strip.faces) >> 1):
+                face_index = other_index - 1
+            elif other_index < len(other_strip.faces) - 1:
+                face_index = other_index + 1
+            else:
+                return found
+
+            strip = other_strip
+
+    def run_experiment(self, start_vertex, start_face):
+        taken = set()
+        strip, start_index = self.build_strip(start_vertex, start_face, taken)
+        strips = [strip]
+
+        num_faces = len(strip.faces)
+        if num_faces >= 4:
+            self.build_adjacent(strips, strip, num_faces >> 1, taken)
+            self.build_adjacent(strips, strip, (num_faces >> 1) + 1, taken)
+        elif num_faces == 3:
+            if not self.build_adjacent(strips, strip, 0, taken):
+                self.build_adjacent(strips, strip, 2, taken)
+            self.build_adjacent(strips, strip, 1, taken)
+        elif num_faces == 2:
+            self.build_adjacent(strips, strip, 0, taken)
+            self.build_adjacent(strips, strip, 1, taken)
+        elif num_faces == 1:
+            self.build_adjacent(strips, strip, 0, taken)
+
+        return strips, taken
+
+    def take(self, taken):
+        for face in taken:
+            self.stripped[face] = 1
+
+    def find_greedy_strips(self):
+        all_strips = []
+
+        for face in range(len(self.faces)):
+            if not self.stripped[face]:
+                taken = set()
+                strip, start_index = self.build_strip(self.faces[face][0], face, taken)
+                self.take(taken)
+                all_strips.append(strip.get_strip())
+
+        return all_strips
+
+    def find_all_strips(self, num_samples):
+        if num_samples == 0:
+            return self.find_greedy_strips()
+
+        all_strips = []
+        remaining = np.arange(len(self.faces))
+        stripped = np.frombuffer(self.stripped, dtype=np.bool_)
+
+        while True:
+            remaining = remaining[~stripped[remaining]]
+            if len(remaining) == 0:
+                return all_strips
+
+            # Same deterministic samples as TriangleStripifier.sample
+            k = min(num_samples, len(remaining))
+            samples = remaining[:1] if k == 1 else remaining[np.arange(k) * (len(remaining) - 1) // (k - 1)]
+
+            best_score = -1.0
+            best_experiment = None
+
+            for face in samples.tolist():
+                for vertex in self.faces[face]:
+                    strips, taken = self.run_experiment(vertex, face)
+                    score = len(taken) / len(strips)
+
+                    if score > best_score:
+                        best_score = score
+                        best_experiment = (strips, taken)
+
+            strips, taken = best_experiment
+            self.take(taken)
+            all_strips.extend(strip.get_strip() for strip in strips)
+
+def find_strips(faces, num_samples):
+    return ArrayStripifier(faces).find_all_strips(num_samples)
+
+def stripify_array(triangles, effort="FULL", stitchstrips=False, jobs=None):
+    # Drop-in for tristrip.stripify, independent parts of the mesh are stripified by worker processes
+    faces = prepare_faces(triangles)
+    num_samples = STRIP_EFFORTS[effort]
+
+    if len(faces) >= PARALLEL_MIN_FACES:
+        chunks = split_components(faces, *build_adjacency(faces), PARALLEL_CHUNKS)
+        jobs = min(get_jobs(jobs), len(chunks))
+
+        # Greedy strips take less time than starting the workers
+        if jobs > 1 and num_samples > 0:
+            with make_process_pool(jobs) as executor:
+                chunk_strips = list(executor.map(find_strips, chunks, repeat(num_samples)))
+        else:
+            chunk_strips = [find_strips(chunk, num_samples) for chunk in chunks]
+
+        strips = [strip for strips in chunk_strips for strip in strips]
+    else:
+        strips = find_strips(faces, num_samples)
+
+    if stitchstrips:
+        return [stitch_strips(strips)]
+    else:
+        return strips
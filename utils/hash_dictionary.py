@@ -0,0 +1,151 @@
+import os
+import mmap
+import stat
+import zlib
+import struct
+import tempfile
+import numpy as np
+
+DEFAULT_HASH_DICTIONARY_PATH = os.path.join(os.path.expanduser("~"), ".studio_eleven", "hash_dictionary.bin")
+
+##########################################
+# Hash Dictionary
+##########################################
+
+class HashDictionary:
+    # File layout: header, sorted crc32 array, name offset array, null terminated UTF-8 names
+    Header = struct.Struct("<4sI")
+    Magic = b"XHD0"
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_HASH_DICTIONARY_PATH
+        self.pending = {}
+        self.mapping = None
+        self.hashes = np.zeros(0, dtype=np.uint32)
+        self.offsets = np.zeros(0, dtype=np.uint32)
+        self.names_offset = 0
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as file:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+
+        # A truncated or foreign file is ignored, it gets rewritten on the next save
+        try:
+            magic, count = self.Header.unpack_from(mapping, 0)
+        except struct.error:
+            magic, count = None, 0
+
+        if magic != self.Magic or len(mapping) < self.Header.size + count * 8:
+            mapping.close()
+            return
+
+        self.mapping = mapping
+        self.hashes = np.frombuffer(mapping, dtype=np.uint32, count=count, offset=self.Header.size)
+        self.offsets = np.frombuffer(mapping, dtype=np.uint32, count=count, offset=self.Header.size + count * 4)
+        self.names_offset = self.Header.size + count * 8
+
+    def __len__(self):
+        return len(self.hashes) + len(self.pending)
+
+    def __contains__(self, crc):
+        return self.get(crc) is not None
+
+    def get(self, crc, default=None):
+        if crc in self.pending:
+            return self.pending[crc]
+
+        # Binary search in the mapped file
+        index = int(np.searchsorted(self.hashes, crc))
+        if index < len(self.hashes) and self.hashes[index] == crc:
+            start = self.names_offset + int(self.offsets[index])
+            end = self.mapping.find(b'\x00', start)
+            return self.mapping[start:end].decode("utf-8")
+
+        return default
+
+    def add(self, name, crc=None):
+        if crc is None:
+            crc = zlib.crc32(name.encode("utf-8"))
+
+        # The first name seen for a hash is kept
+        if name and self.get(crc) is None:
+            self.pending[crc] = name
+
+    def update(self, string_table):
+        for crc, name in string_table.items():
+            self.add(name, crc)
+
+    def save(self):
+        if not self.pending:
+            return
+
+        # Names already in the file are kept as one block, the pending ones are appended after it
+        names_block = self.mapping[self.names_offset:] if self.mapping is not None else b''
+
+        pending_hashes = np.array(sorted(self.pending), dtype=np.uint32)
+        encoded_names = [self.pending[crc].encode("utf-8") + b'\x00' for crc in pending_hashes.tolist()]
+        pending_offsets = len(names_block) + np.cumsum([0] + [len(name) for name in encoded_names[:-1]], dtype=np.int64)
+
+        hashes = np.concatenate((self.hashes, pending_hashes))
+        offsets = np.concatenate((self.offsets.astype(np.int64), pending_offsets))
+        order = np.argsort(hashes, kind='stable')
+
+        if len(names_block) + sum(len(name) for name in encoded_names) > 0xFFFFFFFF:
+            raise Exception("Hash dictionary names don't fit in 4GB")
+
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        # A temp file of its own, so two Blender instances saving at once don't clobber each other
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(self.Header.pack(self.Magic, len(hashes)))
+                file.write(hashes[order].tobytes())
+                file.write(offsets[order].astype(np.uint32).tobytes())
+                file.write(names_block)
+                file.write(b''.join(encoded_names))
+
+            # mkstemp creates the file as 0600, keep the mode of the file it replaces
+            try:
+                mode = stat.S_IMODE(os.stat(self.path).st_mode)
+            except OSError:
+                mode = 0o644
+            os.chmod(temp_path, mode)
+
+            self.close()
+            os.replace(temp_path, self.path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        self.pending = {}
+        self.load()
+
+    def close(self):
+        self.hashes = np.zeros(0, dtype=np.uint32)
+        self.offsets = np.zeros(0, dtype=np.uint32)
+
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+shared_hash_dictionary = None
+
+def get_hash_dictionary():
+    # Shared by every importer and exporter
+    global shared_hash_dictionary
+
+    if shared_hash_dictionary is None:
+        shared_hash_dictionary = HashDictionary()
+
+    return shared_hash_dictionary
@@ -0,0 +1,122 @@
+import os
+import struct
+import hashlib
+import tempfile
+import numpy as np
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".studio_eleven", "texture_cache")
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+##########################################
+# Texture Cache
+##########################################
+
+class TextureCache:
+    # Each entry is a 16 bytes header followed by the raw RGBA8 pixels, bottom row first
+    Header = struct.Struct("<4sHHB7x")
+    Magic = b"XIC0"
+    Extension = ".xic"
+
+    def __init__(self, directory=None, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory or DEFAULT_CACHE_DIRECTORY
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Size of the entries, scanned on the first put and again whenever it goes over max_size
+        self.total_size = None
+
+    def make_key(self, data, *parts):
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        return "_".join([digest] + [str(part) for part in parts])
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + self.Extension)
+
+    def get(self, key):
+        path = self.get_path(key)
+
+        try:
+            with open(path, 'rb') as file:
+                magic, width, height, has_alpha = self.Header.unpack(file.read(self.Header.size))
+        except (OSError, struct.error):
+            return None
+
+        try:
+            if magic != self.Magic or os.path.getsize(path) != self.Header.size + width * height * 4:
+                return None
+
+            pixels = np.memmap(path, dtype=np.uint8, mode='r', offset=self.Header.size, shape=(width * height * 4,))
+            pixels = pixels.astype(np.float32) / 255.0
+
+            # Touch the entry so the eviction sees it as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            # Evicted meanwhile
+            return None
+
+        return pixels, width, height, bool(has_alpha)
+
+    def put(self, key, pixels, width, height, has_alpha):
+        pixels = np.round(np.asarray(pixels, dtype=np.float32) * 255.0).astype(np.uint8)
+
+        # Every writer gets its own temp file, the entry is published by the rename
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(self.Header.pack(self.Magic, width, height, int(has_alpha)))
+                file.write(pixels.tobytes())
+
+            os.replace(temp_path, self.get_path(key))
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        if self.total_size is None:
+            self.total_size = self.scan()[1]
+        else:
+            self.total_size += self.Header.size + pixels.size
+
+        if self.total_size > self.max_size:
+            self.evict()
+
+    def scan(self):
+        entries = []
+        total_size = 0
+
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.Extension):
+                    # Entries can be removed by another thread or process meanwhile
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+
+        return entries, total_size
+
+    def evict(self):
+        entries, total_size = self.scan()
+
+        # Least recently used entries go first
+        entries.sort()
+
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+        self.total_size = total_size
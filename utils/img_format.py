@@ -110,10 +110,10 @@ class RGBA4:
         b = (rgba4 >> 4) & 0xF
         a = rgba4 & 0xF
 
-        r *= 16
-        g *= 16
-        b *= 16
-        a *= 16
+        r *= 0x11
+        g *= 0x11
+        b *= 0x11
+        a *= 0x11
 
         return Color([r, g, b, a])    
 
@@ -141,7 +141,7 @@ class RBGR888:
     has_alpha = False
 
     def encode(self, color):
-        return bytes([(color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF])
+        return bytes([color.b, color.g, color.r])
 
     def decode(self, data, index):
         if len(data) < 3:
@@ -235,7 +235,7 @@ class LA8:
     type = 0x0A
     
     def encode(self, color):
-        return bytes([(((0x4CB2 * (color & 0xFF) + 0x9691 * ((color >> 8) & 0xFF) + 0x1D3E * ((color >> 8) & 0xFF)) >> 16) & 0xFF)])
+        return bytes([L8().encode(color)[0], color.a])
     
     def decode(self, data, index):
         l, a = unpack("2B", data)
@@ -255,7 +255,7 @@ class L8:
     type = 0x0C
     
     def encode(self, color):
-        return bytes([(((0x4CB2 * (color & 0xFF) + 0x9691 * ((color >> 8) & 0xFF) + 0x1D3E * ((color >> 8) & 0xFF)) >> 16) & 0xFF)])
+        return bytes([((0x4CB2 * color.r + 0x9691 * color.g + 0x1D3E * color.b) >> 16) & 0xFF])
     
     def decode(self, data, index):
         r = g = b = unpack("B", data)[0]
@@ -268,7 +268,7 @@ class A8:
     type = 0x0E
     
     def encode(self, color):
-        return bytes([((color >> 24) & 0xFF)])
+        return bytes([color.a])
     
     def decode(self, data, index):
         a = unpack("B", data)[0]
@@ -281,7 +281,7 @@ class LA4:
     type = 0x0B
     
     def encode(self, color):
-        return bytes([((color >> 24) & 0xFF), ((color) & 0xFF), ((color >> 8) & 0xFF), ((color >> 16) & 0xFF)])
+        return bytes([(L8().encode(color)[0] & 0xF0) | (color.a >> 4)])
     
     def decode(self, data, index):
         la = unpack("B", data)[0]
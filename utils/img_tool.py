@@ -173,3 +173,163 @@ def decode_image_optimized(tile, image_data, image_format, width, height, bit_de
     pixels = pixels.flatten()
 
     return pixels, width, height, image_format.has_alpha
+
+def resolve_tiles(tile, image_data, bit_depth):
+    table_value = tile[:len(tile) - len(tile) % 2]
+    entry_length = 2 if struct.unpack('<H', table_value[:2])[0] != 0x453 else 4
+    table_value = table_value[:len(table_value) - len(table_value) % entry_length]
+    entries = np.frombuffer(table_value, dtype='<u2' if entry_length == 2 else '<u4').astype(np.int64)
+
+    # Pad the image data to whole tiles, the last row of tex_value is used for empty tiles
+    block_size = 64 * bit_depth // 8
+    block_count = (len(image_data) + block_size - 1) // block_size
+    tex_value = np.zeros((block_count + 1) * block_size, dtype=np.uint8)
+    tex_value[:len(image_data)] = np.frombuffer(image_data, dtype=np.uint8)
+    tex_value = tex_value.reshape(block_count + 1, block_size)
+
+    entries[entries >= block_count] = block_count
+    return tex_value[entries]
+
+def get_swizzle_index(x, y, stride_width):
+    # Inverse of IMGCSwizzle: bits of the index inside a 8x8 tile alternate between y and x
+    tile_index = (y // 8) * (stride_width // 8) + x // 8
+    inner_index = ((y & 1) | ((x & 1) << 1) | ((y & 2) << 1) | ((x & 2) << 2) | ((y & 4) << 2) | ((x & 4) << 3))
+    return tile_index * 64 + inner_index
+
+def decode_etc1_block_colors(data, has_alpha_channel):
+    block_size = 16 if has_alpha_channel else 8
+    blocks = np.frombuffer(data, dtype=np.uint8)
+    blocks = blocks[:len(blocks) - len(blocks) % block_size].reshape(-1, block_size)
+    colors = np.full((len(blocks), 4), 255, dtype=np.uint8)
+
+    if has_alpha_channel:
+        # 16 alphas of 4 bits, their mean is enough for a preview
+        nibbles = np.concatenate([blocks[:, :8] & 0x0F, blocks[:, :8] >> 4], axis=1)
+        colors[:, 3] = np.round(nibbles.mean(axis=1) * 17).astype(np.uint8)
+        blocks = blocks[:, 8:]
+
+    flags = blocks[:, 4]
+    diff_bit = (flags & 2) == 2
+    bgr = blocks[:, 5:8].astype(np.int32)
+
+    # Both sub-blocks base colors, modifiers are symmetric so their mean approximates the block
+    color0 = np.where(diff_bit[:, None], bgr >> 3, bgr >> 4)
+    color1 = np.where(diff_bit[:, None], np.clip(color0 + ((bgr & 7) + 4) % 8 - 4, 0, 31), bgr & 15)
+    color0 = np.where(diff_bit[:, None], (color0 << 3) | (color0 >> 2), color0 * 17)
+    color1 = np.where(diff_bit[:, None], (color1 << 3) | (color1 >> 2), color1 * 17)
+
+    colors[:, 2::-1] = ((color0 + color1) // 2).astype(np.uint8)
+    return colors
+
+def decode_image_preview(tile, image_data, image_format, width, height, bit_depth, lod):
+    step = 1 << min(lod, 3)
+    stride_width = (width + 0x7) & ~0x7
+    tiles = resolve_tiles(tile, image_data, bit_depth)
+
+    is_etc1 = image_format.name in ("ETC1", "ETC1A4")
+    if is_etc1:
+        # ETC1 is sampled per 4x4 block, it can't go finer than that
+        step = max(step, 4)
+
+    preview_width = (width + step - 1) // step
+    preview_height = (height + step - 1) // step
+    y, x = np.mgrid[0:preview_height, 0:preview_width] * step
+    indices = get_swizzle_index(x, y, stride_width).ravel()
+
+    if is_etc1:
+        block_colors = decode_etc1_block_colors(tiles.tobytes(), image_format.name == "ETC1A4")
+        pixels = block_colors[np.minimum(indices // 16, len(block_colors) - 1)]
+    else:
+        data = tiles.tobytes()
+        pixels = np.zeros((len(indices), 4), dtype=np.uint8)
+
+        for i, index in enumerate(indices.tolist()):
+            if image_format.name == "L4" or image_format.name == "A4":
+                color = image_format.decode(data, index)
+            else:
+                dataIndex = index * image_format.size
+                color = image_format.decode(data[dataIndex:dataIndex + image_format.size], dataIndex)
+            pixels[i] = [color.r, color.g, color.b, color.a]
+
+    # Blender images start from the bottom row
+    pixels = pixels.reshape(preview_height, preview_width, 4)[::-1]
+    pixels = (pixels.astype(np.float32) / 255.0).ravel()
+
+    return pixels, preview_width, preview_height, image_format.has_alpha
+
+def analyze_pixels(px):
+    px = np.ascontiguousarray(px, dtype=np.uint8).reshape(-1, 4)
+
+    # Work on the distinct colors only, weighted by how often they are used
+    colors, counts = np.unique(px.view('<u4').ravel(), return_counts=True)
+    colors = colors.astype('<u4').view(np.uint8).reshape(-1, 4)
+
+    alpha = colors[:, 3]
+    if np.all(alpha == 255):
+        alpha_usage = 'NONE'
+    elif np.all((alpha == 0) | (alpha == 255)):
+        alpha_usage = '1BIT'
+    elif np.all(alpha % 17 == 0):
+        alpha_usage = '4BIT'
+    else:
+        alpha_usage = '8BIT'
+
+    return {
+        "colors": colors,
+        "counts": counts,
+        "color_count": len(colors),
+        "alpha": alpha_usage,
+        "greyscale": bool(np.all((colors[:, 0] == colors[:, 1]) & (colors[:, 1] == colors[:, 2]))),
+    }
+
+def quantize_colors(colors, format_name):
+    # Colors as the hardware expands them after going through the encoder
+    colors = colors.astype(np.int32)
+    r, g, b, a = colors[:, 0], colors[:, 1], colors[:, 2], colors[:, 3]
+    luminance = (0x4CB2 * r + 0x9691 * g + 0x1D3E * b) >> 16
+    opaque = np.full_like(a, 255)
+
+    if format_name == "L8":
+        channels = [luminance, luminance, luminance, opaque]
+    elif format_name == "LA4":
+        l4 = (luminance >> 4) * 17
+        channels = [l4, l4, l4, (a >> 4) * 17]
+    elif format_name == "LA8":
+        channels = [luminance, luminance, luminance, a]
+    elif format_name == "RGB565":
+        r5, g6, b5 = r >> 3, g >> 2, b >> 3
+        channels = [(r5 << 3) | (r5 >> 2), (g6 << 2) | (g6 >> 4), (b5 << 3) | (b5 >> 2), opaque]
+    elif format_name == "RGBA4":
+        channels = [(r >> 4) * 17, (g >> 4) * 17, (b >> 4) * 17, (a >> 4) * 17]
+    elif format_name == "RBGR888":
+        channels = [r, g, b, opaque]
+    else:
+        channels = [r, g, b, a]
+
+    return np.stack(channels, axis=1)
+
+# Formats that can be encoded, smallest first
+auto_formats = [
+    ("L8", lambda analysis: analysis["greyscale"] and analysis["alpha"] == 'NONE'),
+    ("LA4", lambda analysis: analysis["greyscale"] and analysis["alpha"] != '8BIT'),
+    ("LA8", lambda analysis: analysis["greyscale"]),
+    ("RGB565", lambda analysis: analysis["alpha"] == 'NONE'),
+    ("RGBA4", lambda analysis: analysis["alpha"] != '8BIT'),
+    ("RBGR888", lambda analysis: analysis["alpha"] == 'NONE'),
+    ("RGBA8", lambda analysis: True),
+]
+
+def get_quantize_error(analysis, format_name):
+    colors = analysis["colors"]
+    difference = (quantize_colors(colors, format_name) - colors).astype(np.float64)
+    squared_error = (difference * difference).sum(axis=1)
+    return float(np.sqrt((squared_error * analysis["counts"]).sum() / (analysis["counts"].sum() * 4)))
+
+def select_image_format(px, max_error=4.0):
+    analysis = analyze_pixels(px)
+
+    for format_name, is_suitable in auto_formats:
+        if is_suitable(analysis) and get_quantize_error(analysis, format_name) <= max_error:
+            return format_name, analysis
+
+    return "RGBA8", analysis
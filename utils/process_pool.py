@@ -0,0 +1,25 @@
+import os
+import runpy
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+PACKAGE_NAME = __name__.rsplit(".", 2)[0]
+ADDON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+##########################################
+# Process Pool
+##########################################
+
+def get_jobs(jobs=None):
+    return jobs or os.cpu_count() or 1
+
+def make_process_pool(jobs=None):
+    # Workers are spawned rather than forked from Blender, and load the addon the way cli.py
+    # does so its __init__, which needs bpy, never runs in them
+    return ProcessPoolExecutor(
+        max_workers=get_jobs(jobs),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=runpy.run_path,
+        initargs=(os.path.join(ADDON_DIRECTORY, "cli.py"), {"PACKAGE_NAME": PACKAGE_NAME}, "__worker__"),
+    )
@@ -39,6 +39,11 @@ and triangulation of strips."""
 #
 # ***** END LICENSE BLOCK *****
 
+import heapq
+import numpy as np
+
+from collections import deque
+
 from .trianglestripifier import TriangleStripifier
 from .trianglemesh import Mesh
 
@@ -65,6 +70,24 @@ def triangulate(strips):
 
     return triangles
 
+def triangulate_array(strip):
+    """Same as triangulate for a single strip, as a (n, 3) array.
+
+    >>> triangulate_array([1, 0, 1, 2, 3, 4, 5, 6]).tolist()
+    [[0, 2, 1], [1, 2, 3], [2, 4, 3], [3, 4, 5], [4, 6, 5]]
+    """
+
+    strip = np.asarray(strip)
+    if len(strip) < 3:
+        return np.zeros((0, 3), dtype=strip.dtype)
+
+    # Sliding windows, every odd triangle has its last two indices swapped
+    triangles = np.stack([strip[:-2], strip[1:-1], strip[2:]], axis=1)
+    triangles[1::2, 1:] = triangles[1::2, :0:-1]
+
+    degenerate = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | (triangles[:, 2] == triangles[:, 0])
+    return triangles[~degenerate]
+
 def _generate_faces_from_triangles(triangles):
     i = triangles.__iter__()
     while True:
@@ -387,52 +410,91 @@ def stitch_strips(strips):
     [0, 1, 2, 2, 9, 9, 8, 7]
     """
 
-    class ExperimentSelector:
-        """Helper class to select best experiment."""
-        def __init__(self):
-            self.best_ostrip1 = None
-            self.best_ostrip2 = None
-            self.best_num_stitches = None
-            self.best_ostrip_index = None
-
-        def update(self, ostrip_index, ostrip1, ostrip2):
-            num_stitches = ostrip1.get_num_stitches(ostrip2)
-            if ((self.best_num_stitches is None)
-                or (num_stitches < self.best_num_stitches)):
-                self.best_ostrip1 = ostrip1
-                self.best_ostrip2 = ostrip2
-                self.best_ostrip_index = ostrip_index
-                self.best_num_stitches = num_stitches
-
-    # get all strips and their orientation, and their reverse
-    ostrips = [(OrientedStrip(strip), OrientedStrip(strip))
-               for strip in strips if len(strip) >= 3]
-    for ostrip, reversed_ostrip in ostrips:
-        reversed_ostrip.reverse()
+    # get all strips, each one can be stitched in its own orientation or
+    # reversed, with the current strip on the left or on the right
+    ostrips = [OrientedStrip(strip) for strip in strips if len(strip) >= 3]
     # start with one of the strips
     if not ostrips:
         # no strips!
         return []
-    result = ostrips.pop()[0]
+    result = ostrips.pop()
+
+    # a join needs no stitch for a common vertex and one more for a winding
+    # mismatch, so both orientations of every strip are indexed by their
+    # first vertex (to go after result) and last vertex (to go before it)
+    # along with the winding they match; the heaps hold strip indices so
+    # the first strip in the list wins ties, like an exhaustive search
+    orientations = []
+    heads = {}
+    tails = {}
+    any_heads = ([], [])
+    any_tails = ([], [])
+    for index, ostrip in enumerate(ostrips):
+        reversed_ostrip = OrientedStrip(ostrip)
+        reversed_ostrip.reverse()
+        orientations.append((ostrip, reversed_ostrip))
+        for other in (ostrip, reversed_ostrip):
+            winding = other.reversed != bool(len(other.vertices) & 1)
+            heads.setdefault((other.vertices[0], other.reversed), []).append(index)
+            tails.setdefault((other.vertices[-1], winding), []).append(index)
+            any_heads[other.reversed].append(index)
+            any_tails[winding].append(index)
+    remaining = list(range(len(ostrips)))
+    stitched = bytearray(len(ostrips))
+
+    def first_index(heap):
+        # lazily drop the strips already stitched
+        while heap and stitched[heap[0]]:
+            heapq.heappop(heap)
+        return heap[0] if heap else len(ostrips)
+
+    vertices = deque(result.vertices)
+    reversed_ = result.reversed
     # go on as long as there are strips left to process
-    while ostrips:
-        selector = ExperimentSelector()
-
-        for ostrip_index, (ostrip, reversed_ostrip) in enumerate(ostrips):
-            # try various ways of stitching strips
-            selector.update(ostrip_index, result, ostrip)
-            selector.update(ostrip_index, ostrip, result)
-            selector.update(ostrip_index, result, reversed_ostrip)
-            selector.update(ostrip_index, reversed_ostrip, result)
-            # break early if global optimum is already reached
-            if selector.best_num_stitches == 0:
+    for _ in range(len(ostrips)):
+        # winding of a strip after result, and before it, that needs no stitch
+        head_winding = reversed_ != bool(len(vertices) & 1)
+        tail_winding = reversed_
+        candidates = (
+            min(first_index(heads.get((vertices[-1], head_winding), [])),
+                first_index(tails.get((vertices[0], tail_winding), []))),
+            min(first_index(heads.get((vertices[-1], not head_winding), [])),
+                first_index(tails.get((vertices[0], not tail_winding), []))),
+            min(first_index(any_heads[head_winding]),
+                first_index(any_tails[tail_winding])),
+            first_index(remaining))
+        num_stitches = next(n for n in range(4) if candidates[n] < len(ostrips))
+        index = candidates[num_stitches]
+        stitched[index] = True
+
+        # try various ways of stitching strips, in the same order as the
+        # exhaustive search so it picks the same one
+        ostrip, reversed_ostrip = orientations[index]
+        for other, append in ((ostrip, True), (ostrip, False),
+                              (reversed_ostrip, True), (reversed_ostrip, False)):
+            if append:
+                common = vertices[-1] == other.vertices[0]
+                match = other.reversed == head_winding
+            else:
+                common = other.vertices[-1] == vertices[0]
+                match = (other.reversed != bool(len(other.vertices) & 1)) == tail_winding
+            if (0 if common else 2) + (0 if match else 1) == num_stitches:
                 break
-        # get best result, perform the actual stitching, and remove
-        # strip from ostrips
-        result = selector.best_ostrip1 + selector.best_ostrip2
-        ostrips.pop(selector.best_ostrip_index)
+
+        # perform the actual stitching
+        if append:
+            stitches = [vertices[-1], other.vertices[0], other.vertices[0]][:num_stitches]
+            vertices.extend(stitches)
+            vertices.extend(other.vertices)
+        else:
+            stitches = [other.vertices[-1], vertices[0], vertices[0]][:num_stitches]
+            vertices.extendleft(reversed(stitches))
+            vertices.extendleft(reversed(other.vertices))
+            reversed_ = other.reversed
     # get strip
-    strip = list(result)
+    strip = list(vertices)
+    if reversed_:
+        strip.insert(0, strip[0])
     # check if we can remove first vertex by reversing strip
     if strip[0] == strip[1] and (len(strip) & 1 == 0):
         strip = strip[1:]
@@ -0,0 +1,139 @@
+import numpy as np
+
+from collections import deque
+
+# LRU cache modelled by the optimizer, and FIFO cache used to measure the result
+OPTIMIZER_CACHE_SIZE = 32
+ACMR_CACHE_SIZE = 16
+
+# Constants from Tom Forsyth's Linear-Speed Vertex Cache Optimisation
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+##########################################
+# Vertex Cache
+##########################################
+
+def get_acmr(triangles, cache_size=ACMR_CACHE_SIZE):
+    # Average cache miss ratio: transformed vertices per triangle
+    triangles = np.asarray(triangles).reshape(-1, 3)
+    if len(triangles) == 0:
+        return 0.0
+
+    cache = deque()
+    cached = set()
+    misses = 0
+
+    for vertex in triangles.ravel().tolist():
+        if vertex not in cached:
+            misses += 1
+            cache.append(vertex)
+            cached.add(vertex)
+
+            if len(cache) > cache_size:
+                cached.discard(cache.popleft())
+
+    return misses / len(triangles)
+
+def get_vertex_scores(cache_size, max_valence):
+    # Score tables by cache position (the last slot is "not cached") and by remaining valence
+    position_scores = []
+    for position in range(cache_size):
+        if position < 3:
+            position_scores.append(LAST_TRIANGLE_SCORE)
+        else:
+            position_scores.append((1.0 - (position - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER)
+    position_scores.append(0.0)
+
+    valence_scores = [0.0] + [VALENCE_BOOST_SCALE * valence ** -VALENCE_BOOST_POWER for valence in range(1, max_valence + 1)]
+
+    return position_scores, valence_scores
+
+def optimize_vertex_cache(triangles, cache_size=OPTIMIZER_CACHE_SIZE):
+    # Returns the triangles reordered so consecutive ones reuse the recently transformed vertices
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    if len(triangles) == 0:
+        return triangles
+
+    vertex_count = int(triangles.max()) + 1
+    flat = triangles.ravel()
+
+    # Triangles of each vertex, the first valence[v] of its range are the ones not added yet
+    counts = np.bincount(flat, minlength=vertex_count)
+    start = np.zeros(vertex_count + 1, dtype=np.int64)
+    np.cumsum(counts, out=start[1:])
+    vertex_triangles = (np.argsort(flat, kind='stable') // 3).tolist()
+    start = start.tolist()
+    valence = counts.tolist()
+
+    position_scores, valence_scores = get_vertex_scores(cache_size, max(valence))
+    not_cached = cache_size
+    position = [not_cached] * vertex_count
+    vertex_scores = [valence_scores[v] for v in valence]
+
+    tris = triangles.tolist()
+    added = bytearray(len(tris))
+    order = []
+    cache = []
+    best = int(np.argmax(np.asarray(vertex_scores)[triangles].sum(axis=1)))
+    next_unadded = 0
+
+    while True:
+        if best < 0:
+            # Dead end, continue with the next triangle in input order
+            while next_unadded < len(tris) and added[next_unadded]:
+                next_unadded += 1
+            if next_unadded == len(tris):
+                break
+            best = next_unadded
+
+        triangle = tris[best]
+        added[best] = 1
+        order.append(best)
+
+        for vertex in triangle:
+            # Swap the triangle out of the active part of the vertex range
+            first = start[vertex]
+            last = first + valence[vertex] - 1
+            i = vertex_triangles.index(best, first, last + 1)
+            vertex_triangles[i], vertex_triangles[last] = vertex_triangles[last], vertex_triangles[i]
+            valence[vertex] -= 1
+
+        cache = triangle + [vertex for vertex in cache if vertex not in triangle]
+
+        for vertex in cache[cache_size:]:
+            position[vertex] = not_cached
+            vertex_scores[vertex] = valence_scores[valence[vertex]]
+        del cache[cache_size:]
+
+        for i, vertex in enumerate(cache):
+            position[vertex] = i
+            vertex_scores[vertex] = position_scores[i] + valence_scores[valence[vertex]] if valence[vertex] else 0.0
+
+        # Best triangle among the ones using a cached vertex
+        best = -1
+        best_score = -1.0
+        for vertex in cache:
+            first = start[vertex]
+            for candidate in vertex_triangles[first:first + valence[vertex]]:
+                v0, v1, v2 = tris[candidate]
+                score = vertex_scores[v0] + vertex_scores[v1] + vertex_scores[v2]
+                if score > best_score:
+                    best = candidate
+                    best_score = score
+
+    return triangles[order]
+
+def optimize_vertex_fetch(triangles):
+    # Renumbers the vertices in order of first use, returns the new triangles and the old index of each new vertex
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+
+    vertices, first_use = np.unique(triangles.ravel(), return_index=True)
+    remap = vertices[np.argsort(first_use)]
+
+    new_index = np.zeros(int(remap.max()) + 1 if len(remap) else 0, dtype=np.int64)
+    new_index[remap] = np.arange(len(remap))
+
+    return new_index[triangles], remap